@@ -0,0 +1,156 @@
+import argparse
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from collections import defaultdict
+
+from neuralcloud.mock_server import MockNeuralCloudServer
+from neuralcloud.run_manifest import STAGES
+
+parser = argparse.ArgumentParser(
+    description='Measure batch throughput against a local mock of the NeuralCloud Solutions API.')
+parser.add_argument('--edf', type=str,
+                    default='example_output/original_ecg.edf',
+                    help='path to the edf the batch is made of')
+parser.add_argument('--files', type=int,
+                    default=10,
+                    help='number of files in the batch')
+parser.add_argument('--script', type=str,
+                    default='run_all_edfs',
+                    choices=['run_all_edfs', 'analyze_edf'],
+                    help='script to benchmark')
+parser.add_argument('--workers', type=int,
+                    default=4,
+                    help='number of files to upload and analyze concurrently')
+parser.add_argument('--render_workers', type=int,
+                    default=2,
+                    help='number of processes rendering PDFs')
+parser.add_argument('--max_pages', type=int,
+                    default=1,
+                    help='set the number of pages, use -1 for no limit')
+parser.add_argument('--queue_latency', type=float,
+                    default=5.0,
+                    help='seconds a job stays queued')
+parser.add_argument('--processing_time', type=float,
+                    default=10.0,
+                    help='seconds a job stays running')
+parser.add_argument('--failure_rate', type=float,
+                    default=0.0,
+                    help='fraction of jobs that end with an error')
+parser.add_argument('--server_error_rate', type=float,
+                    default=0.0,
+                    help='fraction of API requests answered with a 503')
+parser.add_argument('--rate_limit', type=float,
+                    help='API requests per second before the mock answers with a 429')
+parser.add_argument('--out', type=str,
+                    help='path to the benchmark folder, a temporary folder is used by default')
+
+args = parser.parse_args()
+
+repo_path = os.path.dirname(os.path.abspath(__file__))
+bench_path = args.out or tempfile.mkdtemp(prefix='ecg_benchmark_')
+in_path = os.path.join(bench_path, 'in')
+out_path = os.path.join(bench_path, 'out')
+os.makedirs(in_path, exist_ok=True)
+
+# Give every copy its own patient code so each has a different md5sum and
+# none of them are served from the result cache
+with open(args.edf, 'rb') as f:
+    edf_bytes = bytearray(f.read())
+
+edf_paths = []
+for i in range(args.files):
+    edf_bytes[8:88] = f'BENCH{i:05d} X X X'.ljust(80).encode('ascii')
+    edf_path = os.path.join(in_path, f'recording_{i:05d}.edf')
+    with open(edf_path, 'wb') as f:
+        f.write(edf_bytes)
+    edf_paths.append(edf_path)
+
+server = MockNeuralCloudServer(
+    queue_latency=args.queue_latency,
+    processing_time=args.processing_time,
+    failure_rate=args.failure_rate,
+    server_error_rate=args.server_error_rate,
+    rate_limit=args.rate_limit,
+    seed=0).start()
+
+env = dict(os.environ, API_URL=server.url, API_KEY='ncskey_mock')
+print(f'Running {args.script} on {args.files} files against {server.url}')
+
+start_time = time.time()
+file_latencies = []
+
+if args.script == 'run_all_edfs':
+    subprocess.run([
+        sys.executable, 'run_all_edfs.py',
+        '--path', in_path,
+        '--out', out_path,
+        '--cache_dir', os.path.join(bench_path, 'cache'),
+        '--restart',
+        '--workers', str(args.workers),
+        '--render_workers', str(args.render_workers),
+        '--max_pages', str(args.max_pages)
+    ], cwd=repo_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # Stage latencies are the time between consecutive manifest entries
+    entries = defaultdict(list)
+    with open(os.path.join(out_path, 'manifest.jsonl')) as f:
+        for line in f:
+            entry = json.loads(line)
+            entries[entry['edf']].append(entry)
+
+    stage_latencies = defaultdict(list)
+    succeeded = 0
+    for edf_entries in entries.values():
+        for previous, entry in zip(edf_entries, edf_entries[1:]):
+            if entry.get('stage') in STAGES and entry.get('error') is None:
+                stage_latencies[entry['stage']].append(
+                    entry['time'] - previous['time'])
+
+        if edf_entries[-1].get('stage') == 'rendered':
+            succeeded += 1
+            file_latencies.append(edf_entries[-1]['time'] - edf_entries[0]['time'])
+
+else:
+    stage_latencies = {}
+    succeeded = 0
+    for i, edf_path in enumerate(edf_paths):
+        file_start = time.time()
+        result = subprocess.run([
+            sys.executable, 'analyze_edf.py',
+            '--edf', edf_path,
+            '--out', os.path.join(out_path, str(i))
+        ], cwd=repo_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        if result.returncode == 0:
+            succeeded += 1
+            file_latencies.append(time.time() - file_start)
+
+elapsed = time.time() - start_time
+requests = server.stats()
+server.stop()
+
+# Report
+print(f'{succeeded}/{args.files} files succeeded in {elapsed:.1f} seconds')
+print(f'Throughput: {succeeded / elapsed * 3600:.1f} files/hour')
+
+print('Requests:')
+for name, count in sorted(requests.items()):
+    print(f'  {name:<14} {count:8d}')
+
+print('Latency (seconds):      p50       p95')
+for stage in STAGES:
+    if stage in stage_latencies:
+        p50, p95 = np.percentile(stage_latencies[stage], [50, 95])
+        print(f'  {stage:<18} {p50:8.2f}  {p95:8.2f}')
+if file_latencies:
+    p50, p95 = np.percentile(file_latencies, [50, 95])
+    print(f"  {'file':<18} {p50:8.2f}  {p95:8.2f}")
+
+if args.out is None:
+    shutil.rmtree(bench_path)
@@ -0,0 +1,51 @@
+import argparse
+import os
+import datetime
+
+from neuralcloud.hashing import calculate_md5
+from neuralcloud.result_cache import ResultCache
+
+parser = argparse.ArgumentParser(
+    description='Manage the cache of analysis results used by run_all_edfs.py.')
+parser.add_argument('--cache_dir', type=str,
+                    default=os.path.join('~', '.cache', 'neuralcloud'),
+                    help='path to the cache folder')
+parser.add_argument('--list', action='store_true',
+                    help='list the cached results')
+parser.add_argument('--invalidate', type=str, nargs='+',
+                    help='md5sums or paths to edfs whose results should be removed')
+parser.add_argument('--max_size_gb', type=float,
+                    help='evict the least recently used results until the cache is under this size')
+parser.add_argument('--max_age_days', type=float,
+                    help='evict results that have not been used for this many days')
+
+args = parser.parse_args()
+
+cache = ResultCache(os.path.join(
+    os.path.expanduser(args.cache_dir), 'results'))
+
+if args.invalidate:
+    for key in args.invalidate:
+        md5sum = calculate_md5(key) if os.path.isfile(key) else key
+        if cache.invalidate(md5sum):
+            print(f'Removed {md5sum}')
+        else:
+            print(f'No cached result for {md5sum}')
+
+if args.max_size_gb is not None or args.max_age_days is not None:
+    max_bytes = None
+    if args.max_size_gb is not None:
+        max_bytes = int(args.max_size_gb * 1024 ** 3)
+
+    removed = cache.evict(max_bytes=max_bytes, max_age_days=args.max_age_days)
+    print(f'Evicted {len(removed)} results '
+          f'({sum(meta["size"] for meta in removed) / 1024 ** 2:.1f} MB)')
+
+if args.list:
+    entries = cache.entries()
+    for meta in entries:
+        last_used = datetime.datetime.fromtimestamp(meta['last_used'])
+        print(f'{meta["md5sum"]}  {meta["size"] / 1024 ** 2:10.1f} MB  '
+              f'last used {last_used:%Y-%m-%d %H:%M}  {", ".join(meta["files"])}')
+    print(f'{len(entries)} results, '
+          f'{sum(meta["size"] for meta in entries) / 1024 ** 2:.1f} MB')
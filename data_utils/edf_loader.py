@@ -0,0 +1,225 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyedflib
+
+from data_utils.edf_reader import MappedEdf, CHUNK_SAMPLES
+from data_utils.signal_source import SignalSource, CompactSignal
+from data_utils.signal_cache import open_signal_cache
+
+
+class EdfData:
+    def __init__(self, tracings, sampling_rates, lead_names, units):
+        self.tracings = tracings
+        self.sampling_rates = sampling_rates
+        self.lead_names = lead_names
+        self.units = units
+
+    @property
+    def sampling_rate(self):
+        # All leads of the recordings we analyze share one sampling rate
+        return self.sampling_rates[0]
+
+    def close(self):
+        if isinstance(self.tracings, SignalSource):
+            self.tracings.close()
+
+
+class EdfSignalSource(SignalSource):
+    """
+    **Reads the samples of an EDF on demand**
+
+    Keeps the EDF open and only decodes the sample ranges that are indexed, so sampling a few
+    strips of a multi-day recording does not load the whole recording.
+    """
+
+    def __init__(self, edf_path):
+        self.edf_path = edf_path
+        self.edf_file = pyedflib.EdfReader(edf_path)
+        super().__init__(self.edf_file.signals_in_file,
+                         self.edf_file.getNSamples()[0])
+
+    def read(self, lead, start, n):
+        return self.edf_file.readSignal(lead, start, n)
+
+    def close(self):
+        self.edf_file.close()
+
+    def __reduce__(self):
+        return (EdfSignalSource, (self.edf_path,))
+
+
+def _edf_data(edf_file, tracings):
+    n_leads = edf_file.signals_in_file
+    return EdfData(
+        tracings,
+        list(edf_file.getSampleFrequencies()),
+        edf_file.getSignalLabels(),
+        [edf_file.getPhysicalDimension(i) for i in range(n_leads)])
+
+
+def _decode(edf, samples, workers):
+    n_samples = edf.shape[1]
+
+    def decode_block(block):
+        lead, start = block
+        out = samples[lead, start:start + CHUNK_SAMPLES]
+        if samples.dtype == np.int16:
+            out[:] = edf.digital(lead, start, len(out))
+        else:
+            edf.read(lead, start, len(out), out=out)
+
+    # Blocks of every lead are decoded concurrently straight into `samples`, numpy releases
+    # the GIL while copying and scaling
+    blocks = [(lead, start) for lead in range(edf.shape[0])
+              for start in range(0, n_samples, CHUNK_SAMPLES)]
+    if workers <= 1 or len(blocks) <= 1:
+        for block in blocks:
+            decode_block(block)
+    else:
+        with ThreadPoolExecutor(min(workers, len(blocks))) as executor:
+            list(executor.map(decode_block, blocks))
+
+
+def load_edf(edf_path, lazy=False, dtype=np.int16, workers=None, signal_cache=False):
+    """
+    **Loads every lead of an EDF**
+
+    Parameters
+    ----------
+    edf_path : str
+        The path to the EDF.
+    lazy : bool
+        If True, `tracings` is a SignalSource that reads samples when they are indexed
+        instead of decoded samples. Close the returned EdfData when done with it.
+    dtype : type
+        How decoded samples are kept when not lazy. np.int16 keeps the digital samples and
+        np.float32 the physical values, both in a CompactSignal that converts to float64 only
+        where it is indexed. np.float64 returns a plain array of physical values.
+    workers : Union[None, int]
+        The number of threads decoding leads and record ranges of a memory mapped EDF, the
+        number of CPUs if None.
+    signal_cache : bool
+        If True, samples are read from the decoded-signal cache next to the EDF (see
+        data_utils.signal_cache), which is built on first use. `tracings` is then always read
+        on demand. Falls back to reading the EDF if the cache cannot be written.
+
+    Returns
+    -------
+    EdfData
+        `tracings` holds one row per lead, `sampling_rates` the sampling rate of each lead in
+        Hz, `lead_names` the label of each lead and `units` its physical dimension (e.g. mV).
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.int16, np.float32, np.float64):
+        raise ValueError(f"Unsupported dtype {dtype}")
+
+    if signal_cache:
+        try:
+            source = open_signal_cache(edf_path)
+            return EdfData(source, source.sampling_rates, source.lead_names, source.units)
+        except OSError:
+            pass
+
+    # EDFs are memory mapped, other formats pyedflib reads (e.g. BDF) go through pyedflib
+    try:
+        edf = MappedEdf(edf_path)
+    except ValueError:
+        edf = None
+
+    if edf is not None:
+        if lazy:
+            tracings = edf
+        else:
+            samples = np.empty(edf.shape, dtype=dtype)
+            _decode(edf, samples, workers or os.cpu_count() or 1)
+
+            if dtype == np.int16:
+                tracings = CompactSignal(samples, edf.gains, edf.offsets)
+            elif dtype == np.float32:
+                tracings = CompactSignal(samples)
+            else:
+                tracings = samples
+            edf.close()
+
+        return EdfData(tracings, edf.sampling_rates, edf.lead_names, edf.units)
+
+    if lazy:
+        source = EdfSignalSource(edf_path)
+        return _edf_data(source.edf_file, source)
+
+    edf_file = pyedflib.EdfReader(edf_path)
+    try:
+        n_leads = edf_file.signals_in_file
+        signal_length = edf_file.getNSamples()[0]
+        # BDF digital samples are 24-bit, so they do not fit in int16
+        samples = np.empty((n_leads, signal_length),
+                           dtype=np.int32 if dtype == np.int16 else dtype)
+        for i in range(n_leads):
+            samples[i, :] = edf_file.readSignal(i, digital=dtype == np.int16)
+
+        if dtype == np.int16:
+            # Same conversion as EDFlib: physical = gain * (digital + offset)
+            gains = []
+            offsets = []
+            for i in range(n_leads):
+                gain = ((edf_file.getPhysicalMaximum(i) - edf_file.getPhysicalMinimum(i)) /
+                        (edf_file.getDigitalMaximum(i) - edf_file.getDigitalMinimum(i)))
+                gains.append(gain)
+                offsets.append(edf_file.getPhysicalMaximum(i) / gain - edf_file.getDigitalMaximum(i))
+            tracings = CompactSignal(samples, gains, offsets)
+        elif dtype == np.float32:
+            tracings = CompactSignal(samples)
+        else:
+            tracings = samples
+
+        return _edf_data(edf_file, tracings)
+    finally:
+        edf_file.close()
+
+
+class EdfCache:
+    """
+    **Keeps the most recently loaded EDFs in memory**
+
+    Rendering several artifacts for the same recording then decodes it only once. Entries
+    are keyed by path, size and modification time, so a changed file is loaded again.
+
+    Parameters
+    ----------
+    max_files : int
+        The number of recordings kept in memory.
+    lazy : bool
+        Passed to load_edf. Evicted recordings are closed.
+    signal_cache : bool
+        Passed to load_edf.
+    """
+
+    def __init__(self, max_files: int = 2, lazy: bool = False, signal_cache: bool = False):
+        self.max_files = max_files
+        self.lazy = lazy
+        self.signal_cache = signal_cache
+        self._entries = OrderedDict()
+
+    def load(self, edf_path):
+        stat = os.stat(edf_path)
+        key = (os.path.abspath(edf_path), stat.st_size, stat.st_mtime_ns)
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        edf_data = load_edf(edf_path, self.lazy, signal_cache=self.signal_cache)
+        self._entries[key] = edf_data
+        while len(self._entries) > self.max_files:
+            _, evicted = self._entries.popitem(last=False)
+            evicted.close()
+
+        return edf_data
+
+    def clear(self):
+        for edf_data in self._entries.values():
+            edf_data.close()
+        self._entries.clear()
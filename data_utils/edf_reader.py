@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+
+from data_utils.signal_source import SignalSource
+
+
+ANNOTATIONS_LABEL = 'EDF Annotations'
+
+# Samples scaled per step when converting to physical values
+CHUNK_SAMPLES = 1 << 20
+
+
+def _fields(header, offset, count, width):
+    fields = []
+    for i in range(count):
+        start = offset + i * width
+        fields.append(header[start:start + width].decode('ascii').strip())
+    return fields, offset + count * width
+
+
+class MappedEdf(SignalSource):
+    """
+    **Memory-mapped EDF/EDF+ reader**
+
+    Parses the header and maps the data records as an int16 np.memmap, one row per data
+    record. Each lead is a strided view into those records, so nothing is decoded until
+    samples are read and only the requested ranges are converted to physical values.
+    Processes mapping the same file share the operating system's page cache, and the reader
+    pickles as its path so it can be sent to worker processes.
+
+    EDF+ annotation signals are skipped, like pyedflib does. BDF files are not supported.
+
+    Parameters
+    ----------
+    edf_path : str
+        The path to the EDF.
+    """
+
+    def __init__(self, edf_path):
+        self.edf_path = edf_path
+
+        with open(edf_path, 'rb') as f:
+            fixed = f.read(256)
+            if len(fixed) < 256 or fixed[:8] != b'0       ':
+                raise ValueError(f"{edf_path} is not an EDF file")
+
+            header_bytes = int(fixed[184:192])
+            n_signals = int(fixed[252:256])
+            header = fixed + f.read(header_bytes - 256)
+
+        self.header_bytes = header_bytes
+        self.record_duration = float(header[244:252])
+
+        offset = 256
+        labels, offset = _fields(header, offset, n_signals, 16)
+        _, offset = _fields(header, offset, n_signals, 80)
+        dimensions, offset = _fields(header, offset, n_signals, 8)
+        physical_min, offset = _fields(header, offset, n_signals, 8)
+        physical_max, offset = _fields(header, offset, n_signals, 8)
+        digital_min, offset = _fields(header, offset, n_signals, 8)
+        digital_max, offset = _fields(header, offset, n_signals, 8)
+        _, offset = _fields(header, offset, n_signals, 80)
+        samples_per_record, offset = _fields(header, offset, n_signals, 8)
+        samples_per_record = [int(n) for n in samples_per_record]
+
+        # Start of each signal within a data record
+        record_offsets = np.concatenate(([0], np.cumsum(samples_per_record)))
+        record_samples = int(record_offsets[-1])
+
+        # The header may give -1 records while recording or overstate them in a truncated file
+        n_records = int(header[236:244])
+        file_records = (os.path.getsize(edf_path) - header_bytes) // (2 * record_samples)
+        if n_records < 0 or n_records > file_records:
+            n_records = file_records
+        self.n_records = n_records
+
+        self.records = np.memmap(edf_path, dtype='<i2', mode='r', offset=header_bytes,
+                                 shape=(n_records, record_samples))
+
+        self.leads = [i for i in range(n_signals) if labels[i] != ANNOTATIONS_LABEL]
+        self.lead_names = [labels[i] for i in self.leads]
+        self.units = [dimensions[i] for i in self.leads]
+        self.samples_per_record = [samples_per_record[i] for i in self.leads]
+        self.sampling_rates = [n / self.record_duration for n in self.samples_per_record]
+        self._record_offsets = [int(record_offsets[i]) for i in self.leads]
+
+        # Same conversion as EDFlib: physical = gain * (digital + offset)
+        self.gains = []
+        self.offsets = []
+        for i in self.leads:
+            gain = ((float(physical_max[i]) - float(physical_min[i])) /
+                    (float(digital_max[i]) - float(digital_min[i])))
+            self.gains.append(gain)
+            self.offsets.append(float(physical_max[i]) / gain - float(digital_max[i]))
+
+        super().__init__(len(self.leads),
+                         n_records * self.samples_per_record[0] if self.leads else 0)
+
+    def lead_view(self, lead):
+        """
+        Returns the digital samples of `lead` as a (records, samples per record) view into
+        the memory map. Nothing is copied.
+        """
+        start = self._record_offsets[lead]
+        return self.records[:, start:start + self.samples_per_record[lead]]
+
+    def digital(self, lead, start, n):
+        """
+        Returns `n` digital samples of `lead` starting at sample `start` as int16. Only the
+        data records covering the range are touched.
+        """
+        spr = self.samples_per_record[lead]
+        end = min(start + n, self.n_records * spr)
+        if end <= start:
+            return np.empty(0, dtype=np.int16)
+
+        first_record = start // spr
+        last_record = (end - 1) // spr + 1
+        window = self.lead_view(lead)[first_record:last_record].reshape(-1)
+        return window[start - first_record * spr:end - first_record * spr]
+
+    def read(self, lead, start, n, out=None):
+        """
+        Returns `n` physical samples of `lead` starting at sample `start`, converted in chunks
+        so no full-length temporary is allocated. If `out` is given the samples are written
+        to it.
+        """
+        n = max(min(n, self.n_records * self.samples_per_record[lead] - start), 0)
+        if out is None:
+            out = np.empty(n)
+
+        gain = self.gains[lead]
+        offset = self.offsets[lead]
+        for chunk_start in range(0, n, CHUNK_SAMPLES):
+            chunk_n = min(CHUNK_SAMPLES, n - chunk_start)
+            chunk = out[chunk_start:chunk_start + chunk_n]
+            np.add(self.digital(lead, start + chunk_start, chunk_n), offset, out=chunk)
+            np.multiply(chunk, gain, out=chunk)
+
+        return out
+
+    def close(self):
+        self.records = None
+
+    def __reduce__(self):
+        return (MappedEdf, (self.edf_path,))
@@ -0,0 +1,224 @@
+import numpy as np
+
+
+# Label values, 0 is no wave
+P_WAVE = 1
+QRS_COMPLEX = 2
+T_WAVE = 3
+
+
+def intervals_from_beats(beats):
+    """
+    Returns the onsets, offsets (in milliseconds) and wave types of the P waves, QRS
+    complexes and T waves of the beats in an analysis.json, in the order they are listed.
+    """
+    onsets = []
+    offsets = []
+    waves = []
+    for beat in beats:
+        for p in beat['p']:
+            onsets.append(p['s'])
+            offsets.append(p['e'])
+            waves.append(P_WAVE)
+
+        onsets.append(beat['qrs']['s'])
+        offsets.append(beat['qrs']['e'])
+        waves.append(QRS_COMPLEX)
+
+        if 't' in beat:
+            onsets.append(beat['t']['s'])
+            offsets.append(beat['t']['e'])
+            waves.append(T_WAVE)
+
+    # Missing values become NaN and are skipped
+    return (np.array(onsets, dtype=float), np.array(offsets, dtype=float),
+            np.array(waves, dtype=np.uint8))
+
+
+def intervals_from_pqrst(pqrst_df):
+    """
+    Returns the onsets, offsets (in milliseconds) and wave types of the waves in a pqrst.csv
+    DataFrame, ordered row by row as P, QRS, T.
+    """
+    onsets = pqrst_df[['ECG_P_Onsets', 'ECG_R_Onsets', 'ECG_T_Onsets']].to_numpy(dtype=float)
+    offsets = pqrst_df[['ECG_P_Offsets', 'ECG_R_Offsets', 'ECG_T_Offsets']].to_numpy(dtype=float)
+    waves = np.tile(np.array([P_WAVE, QRS_COMPLEX, T_WAVE], dtype=np.uint8), len(pqrst_df))
+    return onsets.ravel(), offsets.ravel(), waves
+
+
+def _paint_cluster(starts, ends, waves):
+    # Paints overlapping intervals in the order they were listed and returns the runs
+    first = starts.min()
+    painted = np.zeros(ends.max() - first, dtype=np.uint8)
+    for start, end, wave in zip(starts, ends, waves):
+        painted[start - first:end - first] = wave
+
+    changes = np.flatnonzero(np.diff(painted)) + 1
+    run_starts = np.concatenate(([0], changes))
+    run_ends = np.concatenate((changes, [len(painted)]))
+    labeled = painted[run_starts] != 0
+    return (run_starts[labeled] + first, run_ends[labeled] + first,
+            painted[run_starts[labeled]])
+
+
+def interval_indices(onsets, offsets, waves, sampling_rate, signal_length):
+    """
+    **Converts wave intervals in milliseconds to non-overlapping sample ranges**
+
+    Intervals with a NaN onset or offset are dropped and both ends are clipped to the
+    signal. Where intervals overlap, the one listed later wins, as if they were painted onto
+    the signal in order. An interval inside another splits it, and the outer wave resumes
+    after it.
+
+    Returns
+    -------
+    tuple
+        Sorted start (inclusive) and end (exclusive) sample indices and the wave type of each
+        non-empty range.
+    """
+    onsets = np.asarray(onsets, dtype=float)
+    offsets = np.asarray(offsets, dtype=float)
+    waves = np.asarray(waves, dtype=np.uint8)
+
+    valid = ~(np.isnan(onsets) | np.isnan(offsets))
+    starts = np.clip((sampling_rate * onsets[valid] / 1000.0).astype(np.int64),
+                     0, signal_length - 1)
+    ends = np.clip((sampling_rate * offsets[valid] / 1000.0).astype(np.int64),
+                   0, signal_length - 1)
+    waves = waves[valid]
+
+    non_empty = ends > starts
+    starts = starts[non_empty]
+    ends = ends[non_empty]
+    waves = waves[non_empty]
+
+    # Sorted by start, with the listed order kept for equal starts
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = ends[order]
+    waves = waves[order]
+    if len(starts) == 0:
+        return starts, ends, waves
+
+    # Intervals overlapping an earlier one form a cluster. Most intervals are alone and are
+    # kept as they are, only the clusters are painted in their listed order.
+    reach = np.maximum.accumulate(ends)
+    new_cluster = np.concatenate(([True], starts[1:] >= reach[:-1]))
+    cluster_ids = np.cumsum(new_cluster) - 1
+    cluster_sizes = np.bincount(cluster_ids)
+    alone = cluster_sizes[cluster_ids] == 1
+
+    parts = [(starts[alone], ends[alone], waves[alone])]
+    for cluster in np.flatnonzero(cluster_sizes > 1):
+        members = np.flatnonzero(cluster_ids == cluster)
+        members = members[np.argsort(order[members], kind='stable')]
+        parts.append(_paint_cluster(starts[members], ends[members], waves[members]))
+
+    starts = np.concatenate([part[0] for part in parts])
+    ends = np.concatenate([part[1] for part in parts])
+    waves = np.concatenate([part[2] for part in parts]).astype(np.uint8)
+
+    order = np.argsort(starts, kind='stable')
+    return starts[order], ends[order], waves[order]
+
+
+def build_labels(onsets, offsets, waves, sampling_rate, signal_length):
+    """
+    **Builds a per-sample label array from wave intervals**
+
+    Parameters
+    ----------
+    onsets : np.ndarray
+        The onset of each wave in milliseconds.
+    offsets : np.ndarray
+        The offset of each wave in milliseconds.
+    waves : np.ndarray
+        The label of each wave: 1 for P-waves, 2 for QRS complexes and 3 for T-waves.
+    sampling_rate : float
+        The sampling rate of the signal in Hz.
+    signal_length : int
+        The number of samples of the signal.
+
+    Returns
+    -------
+    np.ndarray
+        A uint8 array of `signal_length` labels, 0 where there is no wave. Overlaps are
+        resolved as in `interval_indices`.
+    """
+    return WaveLabels.from_intervals(
+        onsets, offsets, waves, sampling_rate, signal_length).to_dense()
+
+
+class WaveLabels:
+    """
+    **PQRST labels stored as sorted, non-overlapping sample intervals**
+
+    Takes memory proportional to the number of waves instead of the number of samples, and
+    finds the waves in a window with a binary search.
+
+    Parameters
+    ----------
+    starts : np.ndarray
+        The first sample of each wave, sorted.
+    ends : np.ndarray
+        The sample after the last sample of each wave.
+    waves : np.ndarray
+        The label of each wave: 1 for P-waves, 2 for QRS complexes and 3 for T-waves.
+    signal_length : int
+        The number of samples of the labeled signal.
+    """
+
+    def __init__(self, starts, ends, waves, signal_length):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.waves = np.asarray(waves, dtype=np.uint8)
+        self.signal_length = int(signal_length)
+
+    @classmethod
+    def from_intervals(cls, onsets, offsets, waves, sampling_rate, signal_length):
+        """
+        Builds labels from wave onsets and offsets in milliseconds, see `interval_indices`.
+        """
+        return cls(*interval_indices(onsets, offsets, waves, sampling_rate, signal_length),
+                   signal_length)
+
+    @classmethod
+    def from_dense(cls, labels):
+        """
+        Builds labels from a per-sample label array.
+        """
+        labels = np.asarray(labels)
+        if len(labels) == 0:
+            return cls([], [], [], 0)
+
+        changes = np.flatnonzero(np.diff(labels)) + 1
+        run_starts = np.concatenate(([0], changes))
+        run_ends = np.concatenate((changes, [len(labels)]))
+
+        labeled = labels[run_starts] != 0
+        return cls(run_starts[labeled], run_ends[labeled], labels[run_starts[labeled]],
+                   len(labels))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def window(self, start, end):
+        """
+        Returns the labels of samples `start` to `end`, clipped to the window and relative to
+        `start`.
+        """
+        first = np.searchsorted(self.ends, start, side='right')
+        last = np.searchsorted(self.starts, end, side='left')
+
+        return WaveLabels(
+            np.maximum(self.starts[first:last], start) - start,
+            np.minimum(self.ends[first:last], end) - start,
+            self.waves[first:last],
+            end - start)
+
+    def to_dense(self):
+        # Intervals do not overlap, so a running sum of the label steps paints them all at once
+        steps = np.zeros(self.signal_length + 1, dtype=np.int16)
+        steps[self.starts] += self.waves
+        steps[self.ends] -= self.waves
+        return np.cumsum(steps[:-1]).astype(np.uint8)
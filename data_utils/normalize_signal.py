@@ -9,6 +9,11 @@ class NormalizeMethod(Enum):
 
 
 def normalize_signal(signal, normalize_method):
+    # Digital samples (e.g. int16) would overflow in the arithmetic below
+    signal = np.asarray(signal)
+    if not np.issubdtype(signal.dtype, np.floating):
+        signal = signal.astype(np.float64)
+
     if normalize_method == NormalizeMethod.RMS:
         # RMS normalization to signal
         n = signal.shape[0]
@@ -17,8 +22,8 @@ def normalize_signal(signal, normalize_method):
         return n_signal, d
     elif normalize_method == NormalizeMethod.MIN_MAX:
         # min-max normalization
-        minimum = np.minimum(signal)
-        maximum = np.maximum(signal)
+        minimum = np.min(signal)
+        maximum = np.max(signal)
         n_signal = (signal-minimum)/(maximum-minimum)
 
         return n_signal, (minimum, maximum)
@@ -0,0 +1,166 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+from data_utils.signal_source import SignalSource
+from neuralcloud.hashing import calculate_md5
+
+
+# Seconds of one lead stored per .npy file
+CHUNK_SECONDS = 3600
+
+# Appended to the EDF path to name its cache folder
+CACHE_SUFFIX = '.cache'
+
+
+def cache_path_for(edf_path):
+    return edf_path + CACHE_SUFFIX
+
+
+class CachedSignal(SignalSource):
+    """
+    **Reads decoded samples from a signal cache built by `open_signal_cache`**
+
+    Chunks are memory mapped with np.load when first touched, so opening the cache only
+    reads its index. The reader pickles as its path so it can be sent to worker processes.
+
+    Parameters
+    ----------
+    entry_path : str
+        The cache folder of one version of the EDF, holding index.json and the chunks.
+    """
+
+    def __init__(self, entry_path):
+        self.entry_path = entry_path
+        with open(os.path.join(entry_path, 'index.json')) as f:
+            self.index = json.load(f)
+
+        super().__init__(self.index['n_leads'], self.index['n_samples'])
+        self.chunk_samples = self.index['chunk_samples']
+        self.gains = self.index['gains']
+        self.offsets = self.index['offsets']
+        self.sampling_rates = self.index['sampling_rates']
+        self.lead_names = self.index['lead_names']
+        self.units = self.index['units']
+        self._chunks = {}
+
+    def _chunk(self, lead, chunk_i):
+        key = (lead, chunk_i)
+        if key not in self._chunks:
+            self._chunks[key] = np.load(
+                os.path.join(self.entry_path, f'lead{lead:02d}_{chunk_i:05d}.npy'),
+                mmap_mode='r')
+        return self._chunks[key]
+
+    def read(self, lead, start, n):
+        end = min(start + n, self.shape[1])
+        out = np.empty(max(end - start, 0))
+
+        position = start
+        while position < end:
+            chunk_i, chunk_start = divmod(position, self.chunk_samples)
+            chunk = self._chunk(lead, chunk_i)
+            chunk_n = min(len(chunk) - chunk_start, end - position)
+            window = out[position - start:position - start + chunk_n]
+            np.add(chunk[chunk_start:chunk_start + chunk_n], self.offsets[lead], out=window)
+            np.multiply(window, self.gains[lead], out=window)
+            position += chunk_n
+
+        return out
+
+    def close(self):
+        self._chunks.clear()
+
+    def __reduce__(self):
+        return (CachedSignal, (self.entry_path,))
+
+
+def _build(edf_path, entry_path, md5sum, chunk_seconds):
+    # Imported here because the loader itself reads from this cache
+    from data_utils.edf_loader import load_edf
+
+    edf_data = load_edf(edf_path, dtype=np.int16)
+    tracings = edf_data.tracings
+    chunk_samples = int(chunk_seconds * edf_data.sampling_rate)
+
+    tmp_path = entry_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for lead in range(tracings.shape[0]):
+        for chunk_i, start in enumerate(range(0, tracings.shape[1], chunk_samples)):
+            np.save(os.path.join(tmp_path, f'lead{lead:02d}_{chunk_i:05d}.npy'),
+                    tracings.samples[lead, start:start + chunk_samples])
+
+    with open(os.path.join(tmp_path, 'index.json'), 'w') as f:
+        json.dump({
+            'md5sum': md5sum,
+            'n_leads': tracings.shape[0],
+            'n_samples': tracings.shape[1],
+            'chunk_samples': chunk_samples,
+            'gains': [float(g) for g in tracings.gains],
+            'offsets': [float(o) for o in tracings.offsets],
+            'sampling_rates': [float(r) for r in edf_data.sampling_rates],
+            'lead_names': list(edf_data.lead_names),
+            'units': list(edf_data.units)
+        }, f)
+
+    shutil.rmtree(entry_path, ignore_errors=True)
+    os.replace(tmp_path, entry_path)
+
+
+def open_signal_cache(edf_path, chunk_seconds=CHUNK_SECONDS):
+    """
+    **Opens the decoded-signal cache of an EDF, building it if needed**
+
+    The cache is a `<edf>.cache` folder next to the EDF holding per-lead .npy chunks of
+    `chunk_seconds` of digital samples, keyed by the EDF's MD5 hash. The hash is only
+    recomputed when the EDF's size or modification time change, so opening an up to date
+    cache costs a stat and reading a small index. Caches of previous versions of the EDF are
+    removed when it is rebuilt.
+
+    Parameters
+    ----------
+    edf_path : str
+        The path to the EDF.
+    chunk_seconds : float
+        The seconds of one lead stored per chunk.
+
+    Returns
+    -------
+    CachedSignal
+    """
+    cache_path = cache_path_for(edf_path)
+    stamp_path = os.path.join(cache_path, 'stamp.json')
+
+    stat = os.stat(edf_path)
+    stamp = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    cached_stamp = None
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            cached_stamp = json.load(f)
+
+    if cached_stamp is not None and \
+            (cached_stamp['size'], cached_stamp['mtime_ns']) == (stamp['size'], stamp['mtime_ns']):
+        md5sum = cached_stamp['md5sum']
+    else:
+        md5sum = calculate_md5(edf_path)
+
+    entry_path = os.path.join(cache_path, md5sum)
+    if not os.path.exists(os.path.join(entry_path, 'index.json')):
+        # Drop chunks of previous versions of the EDF
+        shutil.rmtree(cache_path, ignore_errors=True)
+        os.makedirs(cache_path)
+        _build(edf_path, entry_path, md5sum, chunk_seconds)
+        cached_stamp = None
+
+    if cached_stamp != {**stamp, 'md5sum': md5sum}:
+        tmp_stamp_path = stamp_path + '.tmp'
+        with open(tmp_stamp_path, 'w') as f:
+            json.dump({**stamp, 'md5sum': md5sum}, f)
+        os.replace(tmp_stamp_path, stamp_path)
+
+    return CachedSignal(entry_path)
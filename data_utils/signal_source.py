@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class SignalSource:
+    """
+    **A multi-lead signal whose samples are read on demand**
+
+    Indexing behaves like a 2D-array of shape (n_leads, n_samples), e.g. `source[lead, s:e]`
+    or `source[:, s:e]`, but only the requested samples are read. Subclasses implement
+    `read`.
+    """
+
+    ndim = 2
+
+    def __init__(self, n_leads, n_samples):
+        self.shape = (int(n_leads), int(n_samples))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read(self, lead, start, n):
+        """
+        Returns `n` samples of `lead` starting at sample `start` as a 1D float array.
+        """
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        lead_key, sample_key = key
+
+        if isinstance(sample_key, slice):
+            start, stop, step = sample_key.indices(self.shape[1])
+        else:
+            sample_key = int(sample_key)
+            if sample_key < 0:
+                sample_key += self.shape[1]
+            start, stop, step = sample_key, sample_key + 1, 1
+        n = max(stop - start, 0)
+
+        def read_lead(lead):
+            return self.read(lead, start, n)[::step] if n > 0 else np.empty(0)
+
+        if isinstance(lead_key, slice):
+            leads = range(*lead_key.indices(self.shape[0]))
+            chunk = np.stack([read_lead(lead) for lead in leads])
+        else:
+            chunk = read_lead(int(lead_key))
+
+        if not isinstance(sample_key, slice):
+            chunk = chunk[..., 0]
+        return chunk
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CompactSignal(SignalSource):
+    """
+    **A multi-lead signal kept in its compact stored form**
+
+    Samples stay int16 digital values (or float32) with a per-lead gain and offset, and are
+    only converted to float64 physical values, `gain * (sample + offset)`, for the ranges
+    that are indexed. A long recording then takes a quarter of the memory of a float64 array.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        A 2D-array of shape (n_leads, n_samples), usually int16 or float32.
+    gains : Union[None, list, np.ndarray]
+        The gain of each lead, 1 if None.
+    offsets : Union[None, list, np.ndarray]
+        The offset of each lead, 0 if None.
+    """
+
+    def __init__(self, samples, gains=None, offsets=None):
+        super().__init__(*samples.shape)
+        self.samples = samples
+        self.gains = np.ones(samples.shape[0]) if gains is None else np.asarray(gains, dtype=float)
+        self.offsets = np.zeros(samples.shape[0]) if offsets is None else np.asarray(offsets, dtype=float)
+
+    @property
+    def dtype(self):
+        return self.samples.dtype
+
+    @property
+    def nbytes(self):
+        return self.samples.nbytes
+
+    def read(self, lead, start, n):
+        chunk = self.samples[lead, start:start + n]
+        return self.gains[lead] * (chunk + self.offsets[lead])
+
+
+class NpySignal(CompactSignal):
+    """
+    **A CompactSignal memory mapped from a .npy file**
+
+    Pickles as its path, so worker processes map the same file instead of receiving a copy.
+    """
+
+    def __init__(self, npy_path, gains=None, offsets=None):
+        self.npy_path = npy_path
+        super().__init__(np.load(npy_path, mmap_mode='r'), gains, offsets)
+
+    def __reduce__(self):
+        return (NpySignal, (self.npy_path, self.gains, self.offsets))
@@ -1,10 +1,11 @@
 import argparse
 import os
-import pyedflib
-import numpy as np
 import pandas as pd
 
+from data_utils.edf_loader import load_edf
+from data_utils.labels import WaveLabels, intervals_from_pqrst
 from visualizer.ecg_to_pdf import ecg_to_pdf
+from visualizer.full_disclosure import full_disclosure_pdf
 
 parser = argparse.ArgumentParser(
     description='Create a PDF showing the output from the NeuralCloud Solutions API.')
@@ -19,69 +20,69 @@ parser.add_argument('--max_pages', type=int,
 parser.add_argument('--out', type=str,
                     default='out',
                     help='path to output folder')
+parser.add_argument('--workers', type=int,
+                    default=1,
+                    help='number of processes rendering pages')
+parser.add_argument('--seed', type=int,
+                    help='seed for the random selection of strips')
+parser.add_argument('--decimate_dpi', type=float,
+                    help='reduce traces to their min/max per pixel column at this DPI')
+parser.add_argument('--signal_cache', action='store_true',
+                    help='cache decoded signals next to each EDF to speed up repeated renders')
+parser.add_argument('--full_disclosure', action='store_true',
+                    help='render every sample as compressed rows, streamed page by page')
+parser.add_argument('--row_seconds', type=float,
+                    default=60,
+                    help='seconds shown by each full disclosure row')
+parser.add_argument('--rows_per_page', type=int,
+                    default=20,
+                    help='number of full disclosure rows on a page')
 
 args = parser.parse_args()
 
 
-# Helper function to convert PQRST CSV to a Numpy array
-def update_labels(label, onset, offset, sampling_rate, labels):
-    # Check nans
-    if np.isnan(onset) or np.isnan(offset):
-        return
-
-    # Convert miliseconds to location
-    s = int(sampling_rate * onset / 1000.0)
-    e = int(sampling_rate * offset / 1000.0)
-
-    # Clip to prevent overflow
-    s = np.clip(s, 0, labels.shape[0] - 1)
-    e = np.clip(e, 0, labels.shape[0] - 1)
-
-    # Set label for region
-    labels[s:e] = label
-
-
-# Save outputs
-os.makedirs(args.out, exist_ok=True)
-
-# Load EDF
-edf_file = pyedflib.EdfReader(args.edf)
-
-n_leads = len(edf_file.getNSamples())
-signal_length = edf_file.getNSamples()[0]
-tracings = np.empty((n_leads, signal_length))
-for i in range(n_leads):
-    sampling_rate = edf_file.getSampleFrequencies()[i]
-    tracing = edf_file.readSignal(i)
-    tracings[i, :] = tracing
-
-# Load pqrst
-labels = None
-if args.pqrst:
-    pqrst_df = pd.read_csv(args.pqrst)
-
-    # Create label array
-    labels = np.zeros((signal_length,), dtype=np.uint8)
-
-    for _, row in pqrst_df.iterrows():
-        p_on = row["ECG_P_Onsets"]
-        p_off = row["ECG_P_Offsets"]
-
-        qrs_on = row["ECG_R_Onsets"]
-        qrs_off = row["ECG_R_Offsets"]
-
-        t_on = row["ECG_T_Onsets"]
-        t_off = row["ECG_T_Offsets"]
-
-        update_labels(1, p_on, p_off, sampling_rate, labels)
-        update_labels(2, qrs_on, qrs_off, sampling_rate, labels)
-        update_labels(3, t_on, t_off, sampling_rate, labels)
-
-# Save
-ecg_to_pdf(
-    sampling_rate=sampling_rate,
-    output_path=os.path.join(args.out, 'tracings.pdf'),
-    tracings=tracings,
-    labels=labels,
-    max_pages=args.max_pages
-)
+# Page workers may be spawned and import this script again, so the PDF is
+# only rendered from the main process
+if __name__ == '__main__':
+    # Save outputs
+    os.makedirs(args.out, exist_ok=True)
+
+    # Load EDF, sampled pages only read the strips they plot and full disclosure
+    # streams the samples of one page at a time
+    edf_data = load_edf(args.edf, lazy=args.max_pages > 0 or args.full_disclosure,
+                        signal_cache=args.signal_cache)
+    tracings = edf_data.tracings
+    sampling_rate = edf_data.sampling_rate
+    signal_length = tracings.shape[1]
+
+    # Load pqrst
+    labels = None
+    if args.pqrst:
+        pqrst_df = pd.read_csv(args.pqrst)
+
+        # Create labels
+        labels = WaveLabels.from_intervals(*intervals_from_pqrst(pqrst_df),
+                                           sampling_rate, signal_length)
+
+    # Save
+    if args.full_disclosure:
+        full_disclosure_pdf(
+            sampling_rate=sampling_rate,
+            output_path=os.path.join(args.out, 'full_disclosure.pdf'),
+            tracings=tracings,
+            labels=labels,
+            row_seconds=args.row_seconds,
+            rows_per_page=args.rows_per_page,
+            decimate_dpi=args.decimate_dpi or 200
+        )
+    else:
+        ecg_to_pdf(
+            sampling_rate=sampling_rate,
+            output_path=os.path.join(args.out, 'tracings.pdf'),
+            tracings=tracings,
+            labels=labels,
+            max_pages=args.max_pages,
+            seed=args.seed,
+            workers=args.workers,
+            decimate_dpi=args.decimate_dpi
+        )
@@ -1,10 +1,10 @@
 import argparse
 import os
-import pyedflib
-import numpy as np
 import json
 
+from data_utils.edf_loader import load_edf
 from visualizer.ecg_to_pdf import Region, ecg_to_pdf
+from visualizer.full_disclosure import full_disclosure_pdf
 
 parser = argparse.ArgumentParser(
     description='Create a PDF showing the events detected from the NeuralCloud Solutions API.')
@@ -20,84 +20,114 @@ parser.add_argument('--max_pages', type=int,
 parser.add_argument('--out', type=str,
                     default='out',
                     help='path to output folder')
+parser.add_argument('--workers', type=int,
+                    default=1,
+                    help='number of processes rendering pages')
+parser.add_argument('--seed', type=int,
+                    help='seed for the random selection of strips')
+parser.add_argument('--decimate_dpi', type=float,
+                    help='reduce traces to their min/max per pixel column at this DPI')
+parser.add_argument('--signal_cache', action='store_true',
+                    help='cache decoded signals next to each EDF to speed up repeated renders')
+parser.add_argument('--full_disclosure', action='store_true',
+                    help='render every sample as compressed rows, streamed page by page')
+parser.add_argument('--row_seconds', type=float,
+                    default=60,
+                    help='seconds shown by each full disclosure row')
+parser.add_argument('--rows_per_page', type=int,
+                    default=20,
+                    help='number of full disclosure rows on a page')
 
 args = parser.parse_args()
 
 
-# Save outputs
-os.makedirs(args.out, exist_ok=True)
-
-# Load EDF
-edf_file = pyedflib.EdfReader(args.edf)
-
-n_leads = len(edf_file.getNSamples())
-signal_length = edf_file.getNSamples()[0]
-tracings = np.empty((n_leads, signal_length))
-for i in range(n_leads):
-    sampling_rate = edf_file.getSampleFrequencies()[i]
-    tracing = edf_file.readSignal(i)
-    tracings[i, :] = tracing
-
-print("Loading JSON ...")
-with open(args.json) as f:
-    d = json.load(f)
-
-    regions = []
-
-    events = d['events']
-
-    afib_events = events['afib']
-    pac_events = events['pac']
-    pvc_events = events['pvc']
-    av_block_events = events['av_block']
-    pause_events = events['pauses']
-
-    for event in afib_events:
-        regions.append(
-            Region(
-                event['s'],
-                event['e'],
-                color='red'
-            ))
-
-    for event in pac_events:
-        regions.append(
-            Region(
-                event['s'],
-                event['e'],
-                color='yellow'
-            ))
-
-    for event in pvc_events:
-        regions.append(
-            Region(
-                event['s'],
-                event['e'],
-                color='orange'
-            ))
-
-    for event in av_block_events:
-        regions.append(
-            Region(
-                event['s'],
-                event['e'],
-                color='green'
-            ))
-
-    for event in pause_events:
-        regions.append(
-            Region(
-                event['s'],
-                event['e'],
-                color='blue'
-            ))
-
-    # Save
-    print('Saving Events ...')
-    ecg_to_pdf(
-        sampling_rate=sampling_rate,
-        output_path=os.path.join(args.out, 'events.pdf'),
-        tracings=tracings,
-        regions=regions,
-        max_pages=args.max_pages
-    )
+# Page workers may be spawned and import this script again, so the PDF is
+# only rendered from the main process
+if __name__ == '__main__':
+    # Save outputs
+    os.makedirs(args.out, exist_ok=True)
+
+    # Load EDF, sampled pages only read the strips they plot and full disclosure
+    # streams the samples of one page at a time
+    edf_data = load_edf(args.edf, lazy=args.max_pages > 0 or args.full_disclosure,
+                        signal_cache=args.signal_cache)
+    tracings = edf_data.tracings
+    sampling_rate = edf_data.sampling_rate
+
+    print("Loading JSON ...")
+    with open(args.json) as f:
+        d = json.load(f)
+
+        regions = []
+
+        events = d['events']
+
+        afib_events = events['afib']
+        pac_events = events['pac']
+        pvc_events = events['pvc']
+        av_block_events = events['av_block']
+        pause_events = events['pauses']
+
+        for event in afib_events:
+            regions.append(
+                Region(
+                    event['s'],
+                    event['e'],
+                    color='red'
+                ))
+
+        for event in pac_events:
+            regions.append(
+                Region(
+                    event['s'],
+                    event['e'],
+                    color='yellow'
+                ))
+
+        for event in pvc_events:
+            regions.append(
+                Region(
+                    event['s'],
+                    event['e'],
+                    color='orange'
+                ))
+
+        for event in av_block_events:
+            regions.append(
+                Region(
+                    event['s'],
+                    event['e'],
+                    color='green'
+                ))
+
+        for event in pause_events:
+            regions.append(
+                Region(
+                    event['s'],
+                    event['e'],
+                    color='blue'
+                ))
+
+        # Save
+        print('Saving Events ...')
+        if args.full_disclosure:
+            full_disclosure_pdf(
+                sampling_rate=sampling_rate,
+                output_path=os.path.join(args.out, 'events_full_disclosure.pdf'),
+                tracings=tracings,
+                regions=regions,
+                row_seconds=args.row_seconds,
+                rows_per_page=args.rows_per_page,
+                decimate_dpi=args.decimate_dpi or 200
+            )
+        else:
+            ecg_to_pdf(
+                sampling_rate=sampling_rate,
+                output_path=os.path.join(args.out, 'events.pdf'),
+                tracings=tracings,
+                regions=regions,
+                max_pages=args.max_pages,
+                seed=args.seed,
+                workers=args.workers,
+                decimate_dpi=args.decimate_dpi
+            )
@@ -0,0 +1,107 @@
+import argparse
+import os
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from tqdm import tqdm
+
+from data_utils.edf_loader import load_edf
+from data_utils.labels import WaveLabels, intervals_from_beats, intervals_from_pqrst
+from visualizer.preview import ecg_to_png, event_regions, preview_outputs
+
+parser = argparse.ArgumentParser(
+    description='Create PNG previews of whole recordings.')
+source = parser.add_mutually_exclusive_group(required=True)
+source.add_argument('--edf', type=str,
+                    help='path to edf')
+source.add_argument('--batch', type=str,
+                    help='output folder of run_all_edfs.py, every recording in it is previewed')
+parser.add_argument('--json', type=str,
+                    help='path to json, its waves and events are shaded')
+parser.add_argument('--pqrst', type=str,
+                    help='path to pqrst csv, its waves are shaded')
+parser.add_argument('--out', type=str,
+                    default='out',
+                    help='path to output folder')
+parser.add_argument('--row_seconds', type=float,
+                    default=60,
+                    help='seconds shown by each row')
+parser.add_argument('--width', type=int,
+                    default=1500,
+                    help='width of the previews in pixels')
+parser.add_argument('--lead_height', type=int,
+                    default=48,
+                    help='height of each lead of a row in pixels')
+parser.add_argument('--rows_per_tile', type=int,
+                    default=60,
+                    help='split previews into tiles of this many rows, use 0 for one contact sheet')
+parser.add_argument('--workers', type=int,
+                    default=1,
+                    help='number of processes previewing recordings of a batch')
+
+args = parser.parse_args()
+
+options = dict(row_seconds=args.row_seconds, width=args.width,
+               lead_height=args.lead_height, rows_per_tile=args.rows_per_tile or None)
+
+
+def preview_edf():
+    os.makedirs(args.out, exist_ok=True)
+
+    edf_data = load_edf(args.edf, lazy=True)
+    tracings = edf_data.tracings
+    sampling_rate = edf_data.sampling_rate
+    signal_length = tracings.shape[1]
+
+    labels = None
+    regions = None
+    if args.json:
+        with open(args.json) as f:
+            d = json.load(f)
+
+        labels = WaveLabels.from_intervals(*intervals_from_beats(d['beats']),
+                                           sampling_rate, signal_length)
+        regions = event_regions(d)
+
+    if args.pqrst:
+        labels = WaveLabels.from_intervals(*intervals_from_pqrst(pd.read_csv(args.pqrst)),
+                                           sampling_rate, signal_length)
+
+    paths = ecg_to_png(
+        sampling_rate=sampling_rate,
+        output_path=os.path.join(args.out, 'preview.png'),
+        tracings=tracings,
+        labels=labels,
+        regions=regions,
+        **options
+    )
+    print(f'Saved {len(paths)} preview(s) to {args.out}')
+
+
+def preview_batch():
+    folders = sorted(os.path.dirname(path) for path in glob.glob(
+        os.path.join(args.batch, '**', 'analysis.json'), recursive=True))
+
+    failed = 0
+    with ProcessPoolExecutor(args.workers) as executor:
+        futures = {executor.submit(preview_outputs, folder, **options): folder
+                   for folder in folders}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                tqdm.write(f'[{futures[future]}] Failed: {e}')
+
+    print(f'Previewed {len(folders) - failed} of {len(folders)} folders')
+
+
+# Worker processes may be spawned and import this script again, so the
+# previews are only started from the main process
+if __name__ == '__main__':
+    if args.batch:
+        preview_batch()
+    else:
+        preview_edf()
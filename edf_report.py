@@ -1,9 +1,8 @@
 import argparse
 import os
-import pyedflib
-import numpy as np
 import json
 
+from data_utils.edf_loader import load_edf
 from visualizer.report import report
 
 parser = argparse.ArgumentParser(
@@ -20,6 +19,10 @@ parser.add_argument('--max_pages', type=int,
 parser.add_argument('--out', type=str,
                     default='out',
                     help='path to output folder')
+parser.add_argument('--decimate_dpi', type=float,
+                    help='reduce traces to their min/max per pixel column at this DPI')
+parser.add_argument('--signal_cache', action='store_true',
+                    help='cache decoded signals next to each EDF to speed up repeated renders')
 
 args = parser.parse_args()
 
@@ -27,16 +30,10 @@ args = parser.parse_args()
 # Save outputs
 os.makedirs(args.out, exist_ok=True)
 
-# Load EDF
-edf_file = pyedflib.EdfReader(args.edf)
-
-n_leads = len(edf_file.getNSamples())
-signal_length = edf_file.getNSamples()[0]
-tracings = np.empty((n_leads, signal_length))
-for i in range(n_leads):
-    sampling_rate = edf_file.getSampleFrequencies()[i]
-    tracing = edf_file.readSignal(i)
-    tracings[i, :] = tracing
+# Load EDF, the report only reads the strips it plots
+edf_data = load_edf(args.edf, lazy=True, signal_cache=args.signal_cache)
+tracings = edf_data.tracings
+sampling_rate = edf_data.sampling_rate
 
 print("Loading JSON ...")
 with open(args.json) as f:
@@ -48,5 +45,6 @@ with open(args.json) as f:
         tracings,
         sampling_rate,
         d,
-        os.path.join(args.out, "report.pdf")
+        os.path.join(args.out, "report.pdf"),
+        decimate_dpi=args.decimate_dpi
     )
@@ -0,0 +1,279 @@
+import os
+import re
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from neuralcloud.hashing import calculate_md5
+from neuralcloud.scheduler import RequestScheduler
+
+
+API_URL = 'https://api.theneuralcloud.com'
+
+# Downloads are streamed to disk in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class NeuralCloudError(RuntimeError):
+    pass
+
+
+class NeuralCloudClient:
+    """
+    **Client for the NeuralCloud Solutions REST API**
+
+    All requests go through one `requests.Session`, so connections to the API and to the
+    upload/download hosts are kept alive and reused instead of doing a new TCP and TLS
+    handshake for every call. The session is safe to share between the threads of a batch.
+
+    Parameters
+    ----------
+    api_key : str
+        The NeuralCloud API key.
+    api_url : Union[None, str]
+        The base URL of the API. If None is given the API_URL environment variable is used,
+        falling back to the NeuralCloud Solutions API.
+    pool_size : int
+        The number of connections kept open per host. This should be at least the number of
+        threads making requests at the same time.
+    download_workers : int
+        The number of output files of a job that are downloaded at the same time.
+    scheduler : Union[None, RequestScheduler]
+        Rate limits and retries every request. If None is given the default rates are used.
+    """
+
+    def __init__(
+            self,
+            api_key: str,
+            api_url: str = None,
+            pool_size: int = 10,
+            download_workers: int = 4,
+            scheduler: RequestScheduler = None):
+        if api_url is None:
+            api_url = os.getenv('API_URL', API_URL)
+
+        self.api_key = api_key
+        self.api_url = api_url.rstrip('/')
+        self.download_workers = download_workers
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _auth_headers(self):
+        # Only API calls are authenticated, presigned upload and download
+        # URLs must not receive the API key
+        return {'Authorization': f'Bearer {self.api_key}'}
+
+    def _request(self, endpoint_class, send, message, idempotent=True):
+        # Connection errors that are not retried are reported like any other API failure
+        try:
+            return self.scheduler.request(endpoint_class, send, idempotent=idempotent)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise NeuralCloudError(f'{message}. {e}') from e
+
+    def _check(self, response, message, expected=(200, 201)):
+        if response.status_code not in expected:
+            raise NeuralCloudError(
+                f'{message}. Status code: {response.status_code} {response.text[:200]}')
+        return response
+
+    def _json(self, response, message):
+        try:
+            return response.json()
+        except ValueError:
+            raise NeuralCloudError(
+                f'{message}. Invalid response: {response.text[:200]}')
+
+    def create_file(self, file_size, md5sum):
+        response = self._request(
+            'files',
+            lambda: self.session.post(f'{self.api_url}/api/v1/files',
+                                      headers=self._auth_headers(),
+                                      json={
+                                          'byte_size': file_size,
+                                          'md5sum': md5sum
+                                      }),
+            'Failed to create the API File',
+            idempotent=False)
+        self._check(response, 'Failed to create the API File')
+        return self._json(response, 'Failed to create the API File')['file']
+
+    def upload_file(self, file, edf_path):
+        upload = file['upload']
+
+        # The file is reopened for every attempt so retries send all of it
+        def send():
+            with open(edf_path, 'rb') as f:
+                return self.session.put(upload['url'],
+                                        headers=upload['headers'],
+                                        data=f)
+
+        response = self._request('uploads', send, 'Failed to upload the file')
+        self._check(response, 'Failed to upload the file', expected=(200,))
+
+    def confirm_file(self, file):
+        response = self._request(
+            'files',
+            lambda: self.session.post(file['upload']['confirmation_url'],
+                                      headers=self._auth_headers()),
+            'Failed to confirm the file',
+            idempotent=False)
+        self._check(response, 'Failed to confirm the file')
+        return self._json(response, 'Failed to confirm the file')['file']
+
+    def launch_job(self, file_id):
+        response = self._request(
+            'jobs',
+            lambda: self.session.post(f'{self.api_url}/api/v1/ecg_wave_analysis',
+                                      headers=self._auth_headers(),
+                                      json={'file_id': file_id}),
+            'Failed to launch the job',
+            idempotent=False)
+        self._check(response, 'Failed to launch the job', expected=(201,))
+        return self._json(response, 'Failed to launch the job')['job']
+
+    def get_job(self, job_id):
+        response = self._request(
+            'status',
+            lambda: self.session.get(f'{self.api_url}/api/v1/jobs/{job_id}',
+                                     headers=self._auth_headers()),
+            f'Failed to get the status of job {job_id}')
+        self._check(response, f'Failed to get the status of job {job_id}')
+        return self._json(response, f'Failed to get the status of job {job_id}')['job']
+
+    def download_file(self, url, output_path, expected_size=None, expected_md5=None):
+        """
+        Streams a file to disk without holding it in memory.
+
+        The data is written to a temporary file next to `output_path`, which is only renamed
+        into place once the size and MD5 hash have been checked against the expected values,
+        the Content-Length header and the ETag (when it is a plain MD5 hash).
+        """
+        tmp_path = output_path + '.part'
+        md5_hash = hashlib.md5()
+        size = 0
+
+        try:
+            response = self._request(
+                'downloads',
+                lambda: self.session.get(url, stream=True, allow_redirects=True),
+                f'Failed to download {output_path}')
+            with response:
+                self._check(response, f'Failed to download {output_path}')
+
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        md5_hash.update(chunk)
+                        size += len(chunk)
+
+                headers = response.headers
+
+            # Content-Length is the encoded size when the body was compressed
+            if expected_size is None and 'Content-Encoding' not in headers:
+                expected_size = headers.get('Content-Length')
+
+            etag = headers.get('ETag', '').strip('"')
+            if expected_md5 is None and re.fullmatch(r'[0-9a-f]{32}', etag):
+                expected_md5 = etag
+
+            if expected_size is not None and int(expected_size) != size:
+                raise NeuralCloudError(
+                    f'Downloaded {size} bytes for {output_path}, expected {expected_size}')
+
+            if expected_md5 is not None and expected_md5 != md5_hash.hexdigest():
+                raise NeuralCloudError(
+                    f'MD5 hash of {output_path} does not match, the download is corrupt')
+
+            os.replace(tmp_path, output_path)
+
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def upload(self, edf_path, md5sum=None, log=print):
+        """
+        Creates an API File for an EDF, uploads it and confirms the upload. Returns the file dict.
+        """
+        file_size = os.path.getsize(edf_path)
+        if md5sum is None:
+            md5sum = calculate_md5(edf_path)
+
+        #
+        # Step 1: Create an API File
+        #
+        log(f'Creating an API File for {edf_path}')
+        file = self.create_file(file_size, md5sum)
+        log(f"Created a new API File with ID: {file['id']}")
+
+        #
+        # Step 2: Upload the file
+        #
+        log(f"Uploading file to {file['upload']['url']}")
+        self.upload_file(file, edf_path)
+        log('Uploaded the file successfully')
+
+        #
+        # Step 3: Confirm the file was uploaded
+        #
+        log('Confirming the file was uploaded')
+        file_status = self.confirm_file(file)['status']
+
+        log(f'API File status: {file_status}')
+        if file_status != 'confirmed':
+            raise NeuralCloudError('File upload confirmation failed')
+
+        return file
+
+    def launch(self, file_id, log=print):
+        """
+        Launches an ECG wave analysis job for an uploaded API File. Returns the job dict.
+        """
+        #
+        # Step 4: Create the job
+        #
+        log('Launching the job')
+        job = self.launch_job(file_id)
+        log(f"Launched a new job with ID {job['id']} (status '{job['status']}')")
+
+        return job
+
+    def submit(self, edf_path, md5sum=None, log=print):
+        """
+        Uploads an EDF and launches an ECG wave analysis job for it. Returns the job dict.
+        """
+        file = self.upload(edf_path, md5sum, log)
+        return self.launch(file['id'], log)
+
+    def download_outputs(self, job, out_path, log=print):
+        """
+        Saves the output files of a completed job to `out_path`.
+        """
+        if job['status'] != 'completed' or 'output_files' not in job:
+            raise NeuralCloudError(
+                'No output files to download or job failed')
+
+        os.makedirs(out_path, exist_ok=True)
+
+        def download(output):
+            filename = output['filename']
+            output_path = os.path.join(out_path, filename)
+
+            log(f'Downloading {filename}')
+            self.download_file(output['url'], output_path,
+                               expected_size=output.get('byte_size'),
+                               expected_md5=output.get('md5sum'))
+            log(f'Saved to {output_path}')
+
+        # Fetch all output files of the job at the same time
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            for _ in executor.map(download, job['output_files']):
+                pass
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,105 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+
+# Large reads keep the number of syscalls low for multi-GB recordings
+BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def _read_chunks(file):
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        n = file.readinto(buffer)
+        if not n:
+            break
+        yield view[:n]
+
+
+# Calculate MD5 hash
+def calculate_md5(file_path):
+    md5_hash = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        for chunk in _read_chunks(file):
+            md5_hash.update(chunk)
+    return md5_hash.hexdigest()
+
+
+def copy_and_md5(src, dst):
+    """
+    Copies `src` to `dst` like `shutil.copy2` and returns the MD5 hash of the file.
+
+    The file is only read once, the hash is computed from the same buffers that are written
+    to the copy.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    md5_hash = hashlib.md5()
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        for chunk in _read_chunks(fsrc):
+            md5_hash.update(chunk)
+            fdst.write(chunk)
+
+    shutil.copystat(src, dst)
+    return md5_hash.hexdigest()
+
+
+class HashCache:
+    """
+    **Persistent cache of MD5 hashes keyed by file path, size and modification time**
+
+    Entries are stored as JSON in `cache_path`. A cached hash is only returned while the
+    file's size and modification time are unchanged, so re-running a batch over an unchanged
+    archive does not rehash any file. The cache can be shared between threads.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+
+        self._entries = {}
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self._entries = json.load(f)
+
+    def get(self, file_path):
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(file_path))
+
+        if (entry is None or
+                entry['size'] != stat.st_size or
+                entry['mtime_ns'] != stat.st_mtime_ns):
+            return None
+
+        return entry['md5']
+
+    def set(self, file_path, md5sum):
+        stat = os.stat(file_path)
+        with self._lock:
+            self._entries[os.path.abspath(file_path)] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'md5': md5sum
+            }
+            self._save()
+
+    def md5(self, file_path):
+        md5sum = self.get(file_path)
+        if md5sum is None:
+            md5sum = calculate_md5(file_path)
+            self.set(file_path, md5sum)
+        return md5sum
+
+    def _save(self):
+        # Write to a temporary file first so a crash never leaves a corrupt cache
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)),
+                    exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.cache_path)
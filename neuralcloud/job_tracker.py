@@ -0,0 +1,133 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+FINISHED_STATUSES = ('completed', 'error')
+
+
+class JobTracker:
+    """
+    **Watches any number of NeuralCloud jobs from one asyncio event loop**
+
+    Each tracked job is polled with its own adaptive interval. Polling starts at `min_interval`,
+    grows by `backoff` after every poll that returns an unchanged status, and resets when the
+    status changes (e.g. from 'queued' to 'running'). All polls share one requests-per-second
+    ceiling and a small fixed pool of HTTP threads, so the number of requests and threads does
+    not grow with the number of jobs.
+
+    Parameters
+    ----------
+    get_job : Callable[[str], dict]
+        Blocking function that fetches a job by its ID and returns the job dict, which must
+        contain a 'status' key.
+    max_requests_per_second : float
+        The maximum number of status requests sent per second across all jobs.
+    min_interval : float
+        Seconds to wait between polls of a job right after it is tracked or changes status.
+    max_interval : float
+        The longest time in seconds a job will go without being polled.
+    backoff : float
+        The factor the poll interval grows by while a job's status does not change.
+    max_concurrent_requests : int
+        The number of status requests that can be in flight at once.
+    """
+
+    def __init__(
+            self,
+            get_job,
+            max_requests_per_second: float = 2.0,
+            min_interval: float = 2.0,
+            max_interval: float = 60.0,
+            backoff: float = 1.5,
+            max_concurrent_requests: int = 4):
+        if max_requests_per_second <= 0:
+            raise ValueError("max_requests_per_second must be positive")
+
+        self.get_job = get_job
+        self.request_interval = 1.0 / max_requests_per_second
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests)
+        self._next_request_time = 0.0
+        # Plain thread locks, since `wait` may run on several event loops and threads
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    async def _throttle(self):
+        # Reserve the next request slot so polls never exceed the ceiling. Nothing is awaited
+        # while the lock is held, so it never blocks the event loop for long
+        with self._lock:
+            now = asyncio.get_running_loop().time()
+            request_time = max(now, self._next_request_time)
+            self._next_request_time = request_time + self.request_interval
+
+        if request_time > now:
+            await asyncio.sleep(request_time - now)
+
+    async def wait(self, job_id, callback=None, on_status=None):
+        """
+        Polls a job until it is completed or has failed and returns the final job dict.
+
+        `callback(job)` is called with the final job dict and `on_status(job)` is called
+        every time the job's status changes, including the first poll.
+        """
+        loop = asyncio.get_running_loop()
+        interval = self.min_interval
+        status = None
+
+        while True:
+            await self._throttle()
+            job = await loop.run_in_executor(self._executor, self.get_job, job_id)
+
+            if job['status'] != status:
+                status = job['status']
+                interval = self.min_interval
+                if on_status is not None:
+                    on_status(job)
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+
+            if status in FINISHED_STATUSES:
+                break
+
+            await asyncio.sleep(interval)
+
+        if callback is not None:
+            callback(job)
+
+        return job
+
+    def track(self, job_id, callback=None, on_status=None):
+        """
+        Thread-safe version of `wait` for code that is not running in an event loop.
+
+        The job is watched from a background event loop shared by all calls, and a
+        `concurrent.futures.Future` resolving to the final job dict is returned.
+        """
+        with self._start_lock:
+            if self._thread is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+
+            loop = self._loop
+
+        return asyncio.run_coroutine_threadsafe(
+            self.wait(job_id, callback, on_status), loop)
+
+    def close(self):
+        with self._start_lock:
+            if self._thread is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._thread = None
+
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,421 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+EXAMPLE_OUTPUT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example_output')
+
+
+def example_analysis(pqrst_path, intervals_path):
+    """
+    Builds an analysis.json from the example pqrst.csv and intervals.csv. The events are
+    synthetic, every 100th beat is a PAC and every 150th beat a PVC, so that the events and
+    report PDFs have something to draw.
+    """
+    pqrst_df = pd.read_csv(pqrst_path)
+    intervals_df = pd.read_csv(intervals_path)
+
+    def wave(onset, offset):
+        return {'s': int(onset), 'e': int(offset), 'd': int(offset - onset)}
+
+    beats = []
+    for _, row in pqrst_df.iterrows():
+        if np.isnan(row['ECG_R_Onsets']) or np.isnan(row['ECG_R_Offsets']):
+            continue
+
+        beat = {'p': [], 'qrs': wave(row['ECG_R_Onsets'], row['ECG_R_Offsets'])}
+        if not (np.isnan(row['ECG_P_Onsets']) or np.isnan(row['ECG_P_Offsets'])):
+            beat['p'].append(wave(row['ECG_P_Onsets'], row['ECG_P_Offsets']))
+        if not (np.isnan(row['ECG_T_Onsets']) or np.isnan(row['ECG_T_Offsets'])):
+            beat['t'] = wave(row['ECG_T_Onsets'], row['ECG_T_Offsets'])
+        beats.append(beat)
+
+    def beat_events(every):
+        return [{'b': i, 's': beats[i]['qrs']['s'], 'e': beats[i]['qrs']['e']}
+                for i in range(every, len(beats), every)]
+
+    def histogram(values):
+        values = values.dropna().astype(int)
+        start, end = int(values.min()), int(values.max())
+        return {'s': start, 'e': end,
+                'bins': np.bincount(values - start, minlength=end - start + 1).tolist()}
+
+    return {
+        'beats': beats,
+        'events': {
+            'afib': [],
+            'pac': beat_events(100),
+            'pvc': beat_events(150),
+            'av_block': [],
+            'bradycardia': [],
+            'tachycardia': [],
+            'pauses': [],
+            'lowest_hr': [],
+            'highest_hr': []
+        },
+        'stats': {
+            'rr_histogram': histogram(intervals_df['RR']),
+            'qtc_histogram': histogram(intervals_df['QT Corrected (Bazett)'])
+        }
+    }
+
+
+class MockNeuralCloudServer:
+    """
+    **Local stand-in for the NeuralCloud Solutions API**
+
+    Implements file creation, the presigned upload PUT, upload confirmation, job launch and
+    job status, and serves canned output files for every job. Uploads are checked against
+    the declared size and md5sum but not stored. Request counts are available from `stats()`
+    or as JSON from GET /mock/stats.
+
+    Parameters
+    ----------
+    host : str
+        The address to listen on.
+    port : int
+        The port to listen on, 0 picks a free port.
+    queue_latency : float
+        Seconds a job stays 'queued'.
+    processing_time : float
+        Seconds a job stays 'running'.
+    failure_rate : float
+        Fraction of jobs that finish with status 'error'.
+    server_error_rate : float
+        Fraction of API requests answered with a 503.
+    rate_limit : Union[None, float]
+        API requests per second allowed before answering with a 429.
+    outputs : Union[None, dict]
+        Output filename to file contents. Defaults to an analysis.json built from the example
+        output and the example ecg.edf.
+    seed : Union[None, int]
+        Seed for the failure and server error draws.
+    """
+
+    def __init__(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            queue_latency: float = 5.0,
+            processing_time: float = 10.0,
+            failure_rate: float = 0.0,
+            server_error_rate: float = 0.0,
+            rate_limit: float = None,
+            outputs=None,
+            seed=None):
+        self.queue_latency = queue_latency
+        self.processing_time = processing_time
+        self.failure_rate = failure_rate
+        self.server_error_rate = server_error_rate
+        self.rate_limit = rate_limit
+
+        if outputs is None:
+            analysis = example_analysis(
+                os.path.join(EXAMPLE_OUTPUT, 'pqrst.csv'),
+                os.path.join(EXAMPLE_OUTPUT, 'intervals.csv'))
+            with open(os.path.join(EXAMPLE_OUTPUT, 'ecg.edf'), 'rb') as f:
+                ecg = f.read()
+            outputs = {
+                'analysis.json': json.dumps(analysis).encode(),
+                'ecg.edf': ecg
+            }
+        self.outputs = outputs
+
+        self._random = random.Random(seed)
+        self._files = {}
+        self._jobs = {}
+        self._counts = Counter()
+        self._window = []
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(_Handler):
+            mock = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _throttled(self):
+        # Sliding one second window over all API requests
+        if self.rate_limit is None:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                return True
+            self._window.append(now)
+            return False
+
+    def _job_status(self, job):
+        elapsed = time.monotonic() - job['created']
+        if elapsed < self.queue_latency:
+            return 'queued'
+        elif elapsed < self.queue_latency + self.processing_time:
+            return 'running'
+        return job['result']
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _api_guard(self, name):
+        # Shared checks for authenticated API endpoints
+        mock = self.mock
+        mock._count(name)
+
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            self._send(401, {'error': 'Unauthorized'})
+            return False
+
+        if mock._throttled():
+            mock._count('rate_limited')
+            self._send(429, {'error': 'Too many requests'},
+                       headers={'Retry-After': '1'})
+            return False
+
+        if mock._random.random() < mock.server_error_rate:
+            mock._count('server_errors')
+            self._send(503, {'error': 'Service unavailable'})
+            return False
+
+        return True
+
+    def _file_json(self, file):
+        base = self.mock.url
+        return {
+            'id': file['id'],
+            'status': file['status'],
+            'upload': {
+                'url': f"{base}/mock/uploads/{file['id']}",
+                'headers': {'Content-Type': 'application/octet-stream'},
+                'confirmation_url': f"{base}/api/v1/files/{file['id']}/confirmation"
+            }
+        }
+
+    def do_POST(self):
+        mock = self.mock
+
+        if self.path == '/api/v1/files':
+            payload = self._read_json()
+            if not self._api_guard('create_file'):
+                return
+
+            file = {
+                'id': str(uuid.uuid4()),
+                'status': 'created',
+                'byte_size': payload['byte_size'],
+                'md5sum': payload['md5sum']
+            }
+            with mock._lock:
+                mock._files[file['id']] = file
+            self._send(201, {'file': self._file_json(file)})
+            return
+
+        match = re.fullmatch(r'/api/v1/files/([\w-]+)/confirmation', self.path)
+        if match:
+            self._read_json()
+            if not self._api_guard('confirm'):
+                return
+
+            file = mock._files.get(match.group(1))
+            if file is None:
+                self._send(404, {'error': 'File not found'})
+                return
+
+            if file['status'] == 'uploaded':
+                file['status'] = 'confirmed'
+            self._send(200, {'file': self._file_json(file)})
+            return
+
+        if self.path == '/api/v1/ecg_wave_analysis':
+            payload = self._read_json()
+            if not self._api_guard('launch_job'):
+                return
+
+            file = mock._files.get(payload.get('file_id'))
+            if file is None or file['status'] != 'confirmed':
+                self._send(422, {'error': 'File is not confirmed'})
+                return
+
+            failed = mock._random.random() < mock.failure_rate
+            job = {
+                'id': str(uuid.uuid4()),
+                'file_id': file['id'],
+                'created': time.monotonic(),
+                'result': 'error' if failed else 'completed'
+            }
+            with mock._lock:
+                mock._jobs[job['id']] = job
+            self._send(201, {'job': {'id': job['id'], 'status': 'queued'}})
+            return
+
+        self._send(404, {'error': 'Not found'})
+
+    def do_PUT(self):
+        mock = self.mock
+        match = re.fullmatch(r'/mock/uploads/([\w-]+)', self.path)
+        if match is None or match.group(1) not in mock._files:
+            self._send(404, {'error': 'Not found'})
+            return
+
+        mock._count('upload')
+        file = mock._files[match.group(1)]
+
+        # Hash the body as it arrives instead of keeping it in memory
+        remaining = int(self.headers.get('Content-Length', 0))
+        md5_hash = hashlib.md5()
+        size = 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            md5_hash.update(chunk)
+            size += len(chunk)
+            remaining -= len(chunk)
+
+        if size != file['byte_size'] or md5_hash.hexdigest() != file['md5sum']:
+            self._send(400, {'error': 'Size or md5sum does not match'})
+            return
+
+        file['status'] = 'uploaded'
+        self._send(200)
+
+    def do_GET(self):
+        mock = self.mock
+
+        match = re.fullmatch(r'/api/v1/jobs/([\w-]+)', self.path)
+        if match:
+            if not self._api_guard('job_status'):
+                return
+
+            job = mock._jobs.get(match.group(1))
+            if job is None:
+                self._send(404, {'error': 'Job not found'})
+                return
+
+            status = mock._job_status(job)
+            job_json = {'id': job['id'], 'status': status}
+            if status == 'completed':
+                job_json['output_files'] = [
+                    {'filename': filename,
+                     'url': f"{mock.url}/mock/outputs/{job['id']}/{filename}"}
+                    for filename in mock.outputs
+                ]
+            self._send(200, {'job': job_json})
+            return
+
+        match = re.fullmatch(r'/mock/outputs/([\w-]+)/([\w.-]+)', self.path)
+        if match:
+            mock._count('download')
+            body = mock.outputs.get(match.group(2))
+            if body is None or match.group(1) not in mock._jobs:
+                self._send(404, {'error': 'Not found'})
+                return
+
+            self._send(200, body, content_type='application/octet-stream',
+                       headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+            return
+
+        if self.path == '/mock/stats':
+            self._send(200, mock.stats())
+            return
+
+        self._send(404, {'error': 'Not found'})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run a local mock of the NeuralCloud Solutions API.')
+    parser.add_argument('--port', type=int,
+                        default=8000,
+                        help='port to listen on')
+    parser.add_argument('--queue_latency', type=float,
+                        default=5.0,
+                        help='seconds a job stays queued')
+    parser.add_argument('--processing_time', type=float,
+                        default=10.0,
+                        help='seconds a job stays running')
+    parser.add_argument('--failure_rate', type=float,
+                        default=0.0,
+                        help='fraction of jobs that end with an error')
+    parser.add_argument('--server_error_rate', type=float,
+                        default=0.0,
+                        help='fraction of API requests answered with a 503')
+    parser.add_argument('--rate_limit', type=float,
+                        help='API requests per second before answering with a 429')
+
+    args = parser.parse_args()
+
+    server = MockNeuralCloudServer(
+        port=args.port,
+        queue_latency=args.queue_latency,
+        processing_time=args.processing_time,
+        failure_rate=args.failure_rate,
+        server_error_rate=args.server_error_rate,
+        rate_limit=args.rate_limit)
+
+    print(f'Mock NeuralCloud API listening on {server.url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import shutil
+import threading
+
+
+def _link_or_copy(src, dst):
+    # Hardlinks cost no space or I/O, fall back to a copy across filesystems
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ResultCache:
+    """
+    **Content-addressed store of analysis outputs keyed by the EDF's MD5 hash**
+
+    Each entry holds the output files of one analysis job (analysis.json, ecg.edf, CSVs, ...)
+    and a meta.json describing them. Files are hardlinked into and out of the cache when
+    possible. Because of this, output files should be replaced rather than edited in place,
+    or the cached copy changes with them.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The folder the entries are stored in.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    def _entry_path(self, md5sum):
+        return os.path.join(self.cache_dir, md5sum[:2], md5sum)
+
+    def _read_meta(self, entry_path):
+        meta_path = os.path.join(entry_path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, entry_path, meta):
+        tmp_path = os.path.join(entry_path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(entry_path, 'meta.json'))
+
+    def get(self, md5sum, out_path):
+        """
+        Materializes the cached outputs for `md5sum` into `out_path`.
+
+        Returns True on a cache hit and False if there is no entry.
+        """
+        entry_path = self._entry_path(md5sum)
+        with self._lock:
+            meta = self._read_meta(entry_path)
+            if meta is None:
+                return False
+
+            os.makedirs(out_path, exist_ok=True)
+            for filename in meta['files']:
+                _link_or_copy(os.path.join(entry_path, filename),
+                              os.path.join(out_path, filename))
+
+            meta['last_used'] = time.time()
+            self._write_meta(entry_path, meta)
+
+        return True
+
+    def put(self, md5sum, out_path, filenames):
+        """
+        Stores the files `filenames` from `out_path` as the outputs for `md5sum`.
+        """
+        entry_path = self._entry_path(md5sum)
+        tmp_path = f'{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(tmp_path)
+
+        size = 0
+        for filename in filenames:
+            src = os.path.join(out_path, filename)
+            _link_or_copy(src, os.path.join(tmp_path, filename))
+            size += os.path.getsize(src)
+
+        now = time.time()
+        self._write_meta(tmp_path, {
+            'md5sum': md5sum,
+            'files': list(filenames),
+            'size': size,
+            'created': now,
+            'last_used': now
+        })
+
+        # Swap the complete entry in so readers never see a partial one
+        with self._lock:
+            if os.path.exists(entry_path):
+                shutil.rmtree(entry_path)
+            os.replace(tmp_path, entry_path)
+
+    def invalidate(self, md5sum):
+        """
+        Removes the entry for `md5sum`. Returns True if an entry was removed.
+        """
+        entry_path = self._entry_path(md5sum)
+        with self._lock:
+            if not os.path.exists(entry_path):
+                return False
+            shutil.rmtree(entry_path)
+        return True
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for prefix in sorted(os.listdir(self.cache_dir)):
+            prefix_path = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+            for md5sum in sorted(os.listdir(prefix_path)):
+                meta = self._read_meta(os.path.join(prefix_path, md5sum))
+                if meta is not None:
+                    entries.append(meta)
+        return entries
+
+    def evict(self, max_bytes=None, max_age_days=None):
+        """
+        Removes entries that have not been used for `max_age_days`, then the least recently
+        used entries until the cache is at most `max_bytes`. Returns the removed entries.
+        """
+        entries = sorted(self.entries(), key=lambda meta: meta['last_used'])
+        removed = []
+
+        if max_age_days is not None:
+            cutoff = time.time() - max_age_days * 24 * 60 * 60
+            removed += [meta for meta in entries if meta['last_used'] < cutoff]
+            entries = [meta for meta in entries if meta['last_used'] >= cutoff]
+
+        if max_bytes is not None:
+            total = sum(meta['size'] for meta in entries)
+            while entries and total > max_bytes:
+                meta = entries.pop(0)
+                total -= meta['size']
+                removed.append(meta)
+
+        for meta in removed:
+            self.invalidate(meta['md5sum'])
+
+        return removed
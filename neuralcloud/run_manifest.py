@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import threading
+
+
+# Stages a file goes through in a batch run, in order
+STAGES = ('hashed', 'uploaded', 'launched',
+          'completed', 'downloaded', 'rendered')
+
+
+class RunManifest:
+    """
+    **Append-only record of how far each file of a batch run has progressed**
+
+    Every stage a file reaches and every failure is appended to a JSON lines file together
+    with a timestamp and any extra fields (md5sum, file_id, job_id, ...). Replaying the file
+    gives the latest state of each file, so an interrupted batch can resume each file from
+    its last completed stage. A partially written last line from a crash is ignored.
+
+    Parameters
+    ----------
+    manifest_path : str
+        The path of the JSON lines file.
+    """
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+
+        self._states = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._apply(entry)
+
+        self._file = open(manifest_path, 'a')
+
+    def _apply(self, entry):
+        state = self._states.setdefault(entry['edf'], {})
+        state.update(entry)
+
+    def _append(self, entry):
+        entry['time'] = time.time()
+        with self._lock:
+            self._apply(entry)
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+
+    def state(self, edf_path):
+        """
+        Returns the latest state of a file. The 'stage' key is the last completed stage and
+        'error' is set if the last attempt failed.
+        """
+        with self._lock:
+            return dict(self._states.get(edf_path, {}))
+
+    def reached(self, edf_path, stage):
+        """
+        Returns True if the file has already completed `stage`.
+        """
+        current = self.state(edf_path).get('stage')
+        return current is not None and STAGES.index(current) >= STAGES.index(stage)
+
+    def start(self, edf_path):
+        """
+        Records the start of an attempt at processing a file, so the time spent on its first
+        stage can be measured.
+        """
+        attempt = self.state(edf_path).get('attempt', 0) + 1
+        self._append({'edf': edf_path, 'attempt': attempt})
+
+    def record(self, edf_path, stage, **fields):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}'")
+        self._append({'edf': edf_path, 'stage': stage, 'error': None, **fields})
+
+    def fail(self, edf_path, error, stage=None):
+        """
+        Records a failure. If `stage` is given the file is rolled back to it, otherwise it
+        resumes from its last completed stage.
+        """
+        entry = {'edf': edf_path, 'error': str(error)}
+        if stage is not None:
+            entry['stage'] = stage
+        self._append(entry)
+
+    def close(self):
+        self._file.close()
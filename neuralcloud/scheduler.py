@@ -0,0 +1,195 @@
+import time
+import random
+import threading
+import email.utils
+import requests
+
+
+# Requests per second allowed for each class of endpoint, None for no limit
+DEFAULT_RATES = {
+    'files': 5.0,
+    'jobs': 2.0,
+    'status': 5.0,
+    'uploads': None,
+    'downloads': 20.0
+}
+
+# Responses that mean the request can be tried again later
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    **Thread-safe token bucket**
+
+    Tokens are added at `rate` per second up to `burst`, and every request takes one.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        if rate <= 0:
+            raise ValueError(f'Rate must be positive, got {rate}')
+
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                else:
+                    wait = (1.0 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Stop handing out tokens, e.g. when the server asks to retry later
+        with self._lock:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_time.timestamp() - time.time())
+
+
+class RequestScheduler:
+    """
+    **Rate limits and retries the requests sent to the API**
+
+    Every request belongs to an endpoint class ('files', 'jobs', 'status', 'uploads' or
+    'downloads') with its own token bucket. Responses with a status in `RETRY_STATUSES` and
+    connection errors are retried with jittered exponential backoff, or after the delay given
+    by a `Retry-After` header. Requests that are not idempotent are only retried on 429, where
+    the server did not process them.
+
+    Parameters
+    ----------
+    rates : Union[None, dict]
+        Requests per second for each endpoint class, overriding `DEFAULT_RATES`.
+    max_retries : int
+        The number of times a request is retried before giving up.
+    backoff : float
+        The base delay in seconds between retries.
+    max_backoff : float
+        The longest delay in seconds between retries.
+    """
+
+    def __init__(
+            self,
+            rates=None,
+            max_retries: int = 5,
+            backoff: float = 1.0,
+            max_backoff: float = 60.0):
+        unknown = set(rates or {}) - set(DEFAULT_RATES)
+        if unknown:
+            raise ValueError(f"Unknown endpoint classes: {', '.join(sorted(unknown))}")
+
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._buckets = {
+            endpoint_class: TokenBucket(rate)
+            for endpoint_class, rate in self.rates.items()
+            if rate is not None
+        }
+        self._start = time.monotonic()
+        self._counts = {endpoint_class: 0 for endpoint_class in self.rates}
+        self._retries = {endpoint_class: 0 for endpoint_class in self.rates}
+        self._lock = threading.Lock()
+
+    def request(self, endpoint_class, send, idempotent=True):
+        """
+        Calls `send()`, which must send one request and return its response, once the
+        endpoint class allows it. Returns the first response that should not be retried.
+        """
+        if endpoint_class not in self.rates:
+            raise ValueError(f"Unknown endpoint class '{endpoint_class}'")
+
+        bucket = self._buckets.get(endpoint_class)
+        attempt = 0
+
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+
+            with self._lock:
+                self._counts[endpoint_class] += 1
+
+            delay = None
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+            else:
+                if (response.status_code not in RETRY_STATUSES or
+                        attempt >= self.max_retries or
+                        (not idempotent and response.status_code != 429)):
+                    return response
+
+                delay = _retry_after(response)
+                if response.status_code == 429 and bucket is not None:
+                    bucket.pause(delay if delay is not None else self.backoff)
+                response.close()
+
+            if delay is None:
+                # Full jitter keeps retrying clients from synchronizing
+                delay = random.uniform(
+                    0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+            with self._lock:
+                self._retries[endpoint_class] += 1
+
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        """
+        Returns the number of requests, retries and the achieved requests per second of each
+        endpoint class.
+        """
+        elapsed = max(time.monotonic() - self._start, 1e-9)
+        with self._lock:
+            return {
+                endpoint_class: {
+                    'requests': self._counts[endpoint_class],
+                    'retries': self._retries[endpoint_class],
+                    'rate': self._counts[endpoint_class] / elapsed
+                }
+                for endpoint_class in self.rates
+            }
+
+    def summary(self):
+        return ', '.join(
+            f"{endpoint_class} {s['rate']:.2f}/s" for endpoint_class, s in self.stats().items()
+            if s['requests'] > 0)
@@ -1,16 +1,25 @@
 import argparse
-import requests
 import time
 import os
-import numpy as np
-import pyedflib
+import sys
 import shutil
-import hashlib
 import json
+import asyncio
+import functools
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from tqdm import tqdm
 from dotenv import load_dotenv
 
-from visualizer.ecg_to_pdf import Region, ecg_to_pdf
-from visualizer.report import report
+from neuralcloud.client import NeuralCloudClient, NeuralCloudError
+from neuralcloud.hashing import HashCache, copy_and_md5
+from neuralcloud.result_cache import ResultCache
+from neuralcloud.run_manifest import RunManifest
+from neuralcloud.scheduler import DEFAULT_RATES, RequestScheduler
+from neuralcloud.job_tracker import JobTracker
+from data_utils.signal_cache import CACHE_SUFFIX
+from visualizer.render_outputs import log, render_outputs
 
 load_dotenv()
 
@@ -25,9 +34,48 @@ parser.add_argument('--max_pages', type=int,
 parser.add_argument('--out', type=str,
                     default='out',
                     help='path to output folder')
+parser.add_argument('--workers', type=int,
+                    default=1,
+                    help='number of files to upload and analyze concurrently')
+parser.add_argument('--render_workers', type=int,
+                    default=2,
+                    help='number of processes rendering PDFs')
+parser.add_argument('--render_queue_size', type=int,
+                    default=2,
+                    help='number of downloaded files that can wait for rendering '
+                    'before uploads are paused')
+parser.add_argument('--max_polls_per_second', type=float,
+                    default=2.0,
+                    help='maximum number of job status requests per second')
+parser.add_argument('--rate_limit', type=str,
+                    action='append', default=[],
+                    help='requests per second for an endpoint class, e.g. jobs=2 '
+                    '(classes: files, jobs, status, uploads, downloads)')
+parser.add_argument('--cache_dir', type=str,
+                    default=os.path.join('~', '.cache', 'neuralcloud'),
+                    help='path to the folder used to cache file hashes and analysis results')
+parser.add_argument('--no_result_cache', action='store_true',
+                    help='always analyze files, even if their results are cached')
+parser.add_argument('--signal_cache', action='store_true',
+                    help='cache decoded signals next to each EDF to speed up repeated renders')
+parser.add_argument('--restart', action='store_true',
+                    help='ignore the progress of previous runs into the same output folder')
 
 args = parser.parse_args()
 
+rates = {}
+for rate_limit in args.rate_limit:
+    endpoint_class, _, rate = rate_limit.partition('=')
+    if endpoint_class not in DEFAULT_RATES:
+        parser.error(f"--rate_limit: unknown endpoint class '{endpoint_class}' "
+                     f"(classes: {', '.join(DEFAULT_RATES)})")
+    try:
+        rates[endpoint_class] = float(rate)
+    except ValueError:
+        parser.error(f"--rate_limit: expected CLASS=RATE, got '{rate_limit}'")
+    if not rates[endpoint_class] > 0:
+        parser.error(f"--rate_limit: the rate of '{endpoint_class}' must be positive")
+
 # Add your API key to the .env file
 API_KEY = os.getenv('API_KEY')
 
@@ -43,7 +91,8 @@ def get_edfs(path):
         return [path]
 
     for file in os.listdir(path):
-        if file == 'analysis':
+        # Signal caches are stored next to their EDFs
+        if file == 'analysis' or file.endswith('.edf' + CACHE_SUFFIX):
             continue
         filepath = os.path.join(path, file)
         if file.endswith('.edf'):
@@ -55,300 +104,237 @@ def get_edfs(path):
             yield from get_edfs(filepath)
 
 
-# Calculate MD5 hash
-def calculate_md5(file_path):
-    md5_hash = hashlib.md5()
-    with open(file_path, 'rb') as file:
-        for chunk in iter(lambda: file.read(4096), b''):
-            md5_hash.update(chunk)
-    return md5_hash.hexdigest()
-
-
-def analyze(edf_file, out_path):
-    file_size = os.path.getsize(edf_file)
-    md5sum = calculate_md5(edf_file)
-
-    #
-    # Step 1: Create an API File
-    #
-    print(f'Creating an API File for {edf_file}')
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {API_KEY}'
-    }
-    payload = {
-        'byte_size': file_size,
-        'md5sum': md5sum
-    }
-
-    response = requests.post('https://api.theneuralcloud.com/api/v1/files',
-                             headers=headers,
-                             data=json.dumps(payload))
-    print(response)
-    data = response.json()
-
-    upload_url = data['file']['upload']['url']
-    file_id = data['file']['id']
-    confirmation_url = data['file']['upload']['confirmation_url']
-    upload_headers = data['file']['upload']['headers']
-
-    print(f'Created a new API File with ID: {file_id}')
-
-    #
-    # Step 2: Upload the file
-    #
-    print(f'Uploading file to {upload_url}')
-    upload_response = requests.put(upload_url,
-                                   headers=upload_headers,
-                                   data=open(edf_file, 'rb'))
-
-    if upload_response.status_code != 200:
-        print(
-            f'Failed to upload the file. Status code: {upload_response.status_code}')
-        exit(1)
-
-    print('Uploaded the file successfully')
-
-    #
-    # Step 3: Confirm the file was uploaded
-    #
-    print('Confirming the file was uploaded')
-    confirmation_response = requests.post(confirmation_url,
-                                          headers={'Authorization': f'Bearer {API_KEY}'})
-    confirmation_data = confirmation_response.json()
-    file_status = confirmation_data['file']['status']
-
-    print(f'API File status: {file_status}')
-    if file_status != 'confirmed':
-        print('File upload confirmation failed')
-        exit(1)
-
-    #
-    # Step 4: Create the job
-    #
-    print('Launching the job')
-    job_payload = {
-        'file_id': file_id
-    }
-    job_response = requests.post('https://api.theneuralcloud.com/api/v1/ecg_wave_analysis',
-                                 headers={
-                                     'Content-Type': 'application/json',
-                                     'Authorization': f'Bearer {API_KEY}'
-                                 },
-                                 data=json.dumps(job_payload))
-    job_data = job_response.json()
-    job_id = job_data['job']['id']
-    job_status = job_data['job']['status']
-
-    print(f'Launched a new job with ID {job_id} (status \'{job_status}\')')
-
-    if job_response.status_code != 201:
-        print('Failed to launch the job')
-        exit(1)
-
-    # Check job status until completion
-    url = f'https://api.theneuralcloud.com/api/v1/jobs/{job_id}'
-    headers = {'Authorization': f'Bearer {API_KEY}'}
-
-    while not (job_status == 'completed' or job_status == 'error'):
-        print(f'Current job status: {job_status}')
-
-        # Sleep so we are not constantly calling the server
-        time.sleep(5)
-
-        # Get status
-        r = requests.get(url, headers=headers)
-        data = r.json()
-        job_status = data['job']['status']
-
-    # Print the results
-    print('Job completed with status:', job_status)
-    print(json.dumps(data, indent=2))
-
-    # Save outputs
-    if job_status == 'completed' and 'output_files' in data['job']:
-        os.makedirs(out_path, exist_ok=True)
-
-        for output in data['job']['output_files']:
-            # Get filename
-            filename = output['filename']
-
-            # Get url
-            url = output['url']
-
-            print(f'Downloading {filename}')
-
-            # Download the file
-            r = requests.get(url, allow_redirects=True)
+async def analyze(edf_path, folder_path, md5sum, file_log):
+    loop = asyncio.get_running_loop()
+    job = None
 
-            # Write the file to disk
-            output_path = os.path.join(out_path, filename)
-            with open(output_path, 'wb') as f:
-                f.write(r.content)
+    if not manifest.reached(edf_path, 'uploaded'):
+        file = await loop.run_in_executor(
+            network_executor, client.upload, edf_path, md5sum, file_log)
+        manifest.record(edf_path, 'uploaded', file_id=file['id'])
+
+    if not manifest.reached(edf_path, 'launched'):
+        job = await loop.run_in_executor(
+            network_executor, client.launch, manifest.state(edf_path)['file_id'], file_log)
+        manifest.record(edf_path, 'launched', job_id=job['id'])
+
+    job_id = manifest.state(edf_path)['job_id']
+
+    if not manifest.reached(edf_path, 'completed'):
+        if job is None:
+            file_log(f'Re-attaching to job {job_id}')
+
+        # Wait for the job without holding a thread
+        job = await tracker.wait(
+            job_id,
+            on_status=lambda job: file_log(f"Current job status: {job['status']}"))
+
+        file_log(f"Job completed with status: {job['status']}")
+        file_log(json.dumps(job, indent=2))
 
-            print(f'Saved to {output_path}')
-    else:
-        print('No output files to download or job failed')
+        if job['status'] != 'completed':
+            # A failed job cannot be resumed, launch a new one next run
+            manifest.record(edf_path, 'uploaded')
+            raise NeuralCloudError(
+                f"Job {job_id} finished with status '{job['status']}'")
+
+        manifest.record(edf_path, 'completed')
 
+    if job is None:
+        # Resuming a completed job, fetch it again for fresh download URLs
+        job = await loop.run_in_executor(network_executor, client.get_job, job_id)
+
+    await loop.run_in_executor(
+        network_executor, client.download_outputs, job, folder_path, file_log)
+    manifest.record(edf_path, 'downloaded')
+
+    if result_cache is not None:
+        filenames = [output['filename'] for output in job['output_files']]
+        await loop.run_in_executor(
+            network_executor, result_cache.put, md5sum, folder_path, filenames)
 
-# Helper function to convert PQRST CSV to a Numpy array
-def update_labels(label, onset, offset, sampling_rate, labels):
-    # Check nans
-    if np.isnan(onset) or np.isnan(offset):
-        return
-
-    # Convert miliseconds to location
-    s = int(sampling_rate * onset / 1000.0)
-    e = int(sampling_rate * offset / 1000.0)
-
-    # Clip to prevent overflow
-    s = np.clip(s, 0, labels.shape[0] - 1)
-    e = np.clip(e, 0, labels.shape[0] - 1)
-
-    # Set label for region
-    labels[s:e] = label
-
-
-def save_tracing(edf_path, json_data, output_path):
-    # Load EDF
-    edf_file = pyedflib.EdfReader(edf_path)
-
-    n_leads = len(edf_file.getNSamples())
-    signal_length = edf_file.getNSamples()[0]
-    tracings = np.empty((n_leads, signal_length))
-    for i in range(n_leads):
-        sampling_rate = edf_file.getSampleFrequencies()[i]
-        tracing = edf_file.readSignal(i)
-        tracings[i, :] = tracing
-
-    # Create label array
-    labels = np.zeros((signal_length,), dtype=np.uint8)
-
-    for beat in json_data['beats']:
-        p_waves = beat['p']
-
-        for p in p_waves:
-            update_labels(1, p['s'], p['e'], sampling_rate, labels)
-
-        update_labels(2, beat['qrs']['s'], beat['qrs']
-                      ['e'], sampling_rate, labels)
-
-        if 't' in beat:
-            t_on = beat['t']['s']
-            t_off = beat['t']['e']
-            update_labels(3, t_on, t_off, sampling_rate, labels)
-
-    # Save
-    ecg_to_pdf(
-        sampling_rate=sampling_rate,
-        output_path=output_path,
-        tracings=tracings,
-        labels=labels,
-        max_pages=args.max_pages
-    )
-
-
-# Save outputs
-os.makedirs(args.out, exist_ok=True)
-
-
-for edf_path in get_edfs(args.path):
-    folder_path = edf_path.replace(args.path, args.out)[:-4] + '/'
-    os.makedirs(folder_path, exist_ok=True)
-
-    print(f'{edf_path} - {folder_path}')
-
-    # Copy orignal to output
-    shutil.copy2(edf_path, folder_path)
-
-    # Analyze file
-    analyze(edf_path, folder_path)
-
-    print('Loading JSON ...')
-    with open(os.path.join(folder_path, 'analysis.json')) as f:
-        d = json.load(f)
-
-        save_tracing(edf_path, d, os.path.join(folder_path, 'tracing.pdf'))
-        save_tracing(os.path.join(folder_path, 'ecg.edf'), d,
-                     os.path.join(folder_path, 'clean_tracing.pdf'))
-
-        if 'events' in d and 'stats' in d:
-            # Load EDF
-            edf_file = pyedflib.EdfReader(edf_path)
-
-            n_leads = len(edf_file.getNSamples())
-            signal_length = edf_file.getNSamples()[0]
-            tracings = np.empty((n_leads, signal_length))
-            for i in range(n_leads):
-                sampling_rate = edf_file.getSampleFrequencies()[i]
-                tracing = edf_file.readSignal(i)
-                tracings[i, :] = tracing
-
-            # Save
-            print('Saving Report ...')
-            report(
-                tracings,
-                sampling_rate,
-                d,
-                os.path.join(folder_path, 'report.pdf')
-            )
-
-            regions = []
-
-            events = d['events']
-
-            afib_events = events['afib']
-            pac_events = events['pac']
-            pvc_events = events['pvc']
-            av_block_events = events['av_block']
-            pause_events = events['pauses']
-
-            for event in afib_events:
-                regions.append(
-                    Region(
-                        event['s'],
-                        event['e'],
-                        color='red'
-                    ))
-
-            for event in pac_events:
-                regions.append(
-                    Region(
-                        event['s'],
-                        event['e'],
-                        color='yellow'
-                    ))
-
-            for event in pvc_events:
-                regions.append(
-                    Region(
-                        event['s'],
-                        event['e'],
-                        color='orange'
-                    ))
-
-            for event in av_block_events:
-                regions.append(
-                    Region(
-                        event['s'],
-                        event['e'],
-                        color='green'
-                    ))
-
-            for event in pause_events:
-                regions.append(
-                    Region(
-                        event['s'],
-                        event['e'],
-                        color='blue'
-                    ))
-
-            # Save
-            print('Saving Events ...')
-            ecg_to_pdf(
-                sampling_rate=sampling_rate,
-                output_path=os.path.join(folder_path, 'events.pdf'),
-                tracings=tracings,
-                regions=regions,
-                max_pages=args.max_pages
-            )
+
+async def render_worker():
+    loop = asyncio.get_running_loop()
+
+    while True:
+        edf_path, folder_path, rendered = await render_queue.get()
+        try:
+            await loop.run_in_executor(
+                render_executor,
+                functools.partial(render_outputs, signal_cache=args.signal_cache),
+                edf_path, folder_path, args.max_pages)
+            rendered.set_result(None)
+        except Exception as e:
+            rendered.set_exception(e)
+        render_queue.task_done()
+
+
+async def process(edf_path, folder_path):
+    loop = asyncio.get_running_loop()
+
+    def file_log(message):
+        log(edf_path, message)
+
+    if manifest.reached(edf_path, 'rendered'):
+        file_log('Already completed in a previous run')
+        return False
+
+    state = manifest.state(edf_path)
+    if 'stage' in state:
+        file_log(f"Resuming after stage '{state['stage']}'")
+
+    try:
+        async with semaphore:
+            file_log(f'Saving outputs to {folder_path}')
+            manifest.start(edf_path)
+
+            # Copy orignal to output. Unless the hash is already cached, it
+            # is computed from the same read as the copy.
+            def copy_and_hash():
+                md5sum = hash_cache.get(edf_path)
+                if md5sum is None:
+                    md5sum = copy_and_md5(edf_path, folder_path)
+                    hash_cache.set(edf_path, md5sum)
+                else:
+                    shutil.copy2(edf_path, folder_path)
+                return md5sum
+
+            if not manifest.reached(edf_path, 'hashed'):
+                md5sum = await loop.run_in_executor(network_executor, copy_and_hash)
+                manifest.record(edf_path, 'hashed', md5sum=md5sum)
+
+            md5sum = manifest.state(edf_path)['md5sum']
+
+            # Files with the same contents are analyzed one at a time, so
+            # duplicates in the batch are served from the result cache
+            if not manifest.reached(edf_path, 'downloaded'):
+                async with md5_locks[md5sum]:
+                    if result_cache is not None and await loop.run_in_executor(
+                            network_executor, result_cache.get, md5sum, folder_path):
+                        file_log(f'Loaded cached results for {md5sum}')
+                        manifest.record(edf_path, 'downloaded', cached=True)
+                    else:
+                        await analyze(edf_path, folder_path, md5sum, file_log)
+
+            # Hand the file over to the renderers. This waits while the
+            # queue is full, which pauses uploads until rendering catches up.
+            rendered = loop.create_future()
+            await render_queue.put((edf_path, folder_path, rendered))
+
+        await rendered
+        manifest.record(edf_path, 'rendered')
+
+    except Exception as e:
+        manifest.fail(edf_path, e)
+        raise
+
+    return True
+
+
+async def run_batch():
+    # Renderers run in worker processes, fed by the bounded render queue
+    render_workers = [asyncio.ensure_future(render_worker())
+                      for _ in range(args.render_workers)]
+
+    tasks = [asyncio.ensure_future(process(edf_path, folder_path))
+             for edf_path, folder_path in jobs]
+
+    with tqdm(total=len(tasks), desc='Files') as progress:
+        def update(_):
+            progress.set_postfix_str(scheduler.summary())
+            progress.update()
+
+        for task in tasks:
+            task.add_done_callback(update)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for render_task in render_workers:
+        render_task.cancel()
+
+    failed = []
+    skipped = 0
+    for (edf_path, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            log(edf_path, f'Failed: {result}')
+            failed.append((edf_path, result))
+        elif result is False:
+            skipped += 1
+
+    return failed, skipped
+
+
+# Render worker processes are spawned and import this script again, so the
+# batch itself only runs in the main process
+if __name__ == '__main__':
+    # Save outputs
+    os.makedirs(args.out, exist_ok=True)
+
+    # Progress of every file is recorded so an interrupted run can resume
+    manifest_path = os.path.join(args.out, 'manifest.jsonl')
+    if args.restart and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    manifest = RunManifest(manifest_path)
+
+    jobs = []
+    for edf_path in get_edfs(args.path):
+        folder_path = edf_path.replace(args.path, args.out)[:-4] + '/'
+        os.makedirs(folder_path, exist_ok=True)
+        jobs.append((edf_path, folder_path))
+
+    # Up to args.workers files go through upload, analysis and download at
+    # once. Their jobs are all polled from one event loop, so waiting on the
+    # analysis queue does not hold a thread. The client keeps enough pooled
+    # connections for every worker's downloads plus the job tracker's polls.
+    cache_dir = os.path.expanduser(args.cache_dir)
+    hash_cache = HashCache(os.path.join(cache_dir, 'md5.json'))
+    result_cache = None
+    if not args.no_result_cache:
+        result_cache = ResultCache(os.path.join(cache_dir, 'results'))
+    tracker_connections = 4
+    download_workers = 4
+    scheduler = RequestScheduler(rates)
+    client = NeuralCloudClient(
+        API_KEY,
+        pool_size=args.workers * download_workers + tracker_connections,
+        download_workers=download_workers,
+        scheduler=scheduler)
+    tracker = JobTracker(
+        client.get_job,
+        max_requests_per_second=args.max_polls_per_second,
+        max_concurrent_requests=tracker_connections)
+    network_executor = ThreadPoolExecutor(max_workers=args.workers)
+    semaphore = asyncio.Semaphore(args.workers)
+    md5_locks = defaultdict(asyncio.Lock)
+
+    # Rendering is CPU bound, so it runs in separate processes while the
+    # next files upload and wait on the analysis queue
+    render_executor = ProcessPoolExecutor(
+        max_workers=args.render_workers,
+        mp_context=multiprocessing.get_context('spawn'))
+    render_queue = asyncio.Queue(maxsize=args.render_queue_size)
+
+    start_time = time.time()
+    failed, skipped = asyncio.run(run_batch())
+    tracker.close()
+    client.close()
+    manifest.close()
+    network_executor.shutdown()
+    render_executor.shutdown()
+
+    # Batch summary
+    elapsed = time.time() - start_time
+    print(f'Processed {len(jobs)} files in {elapsed:.1f} seconds '
+          f'({len(jobs) - len(failed) - skipped} succeeded, '
+          f'{skipped} already completed, {len(failed)} failed)')
+    for edf_path, e in failed:
+        print(f'  {edf_path}: {e}')
+
+    print('API requests:')
+    for endpoint_class, stats in scheduler.stats().items():
+        print(f"  {endpoint_class:<10} {stats['requests']:6d} requests "
+              f"{stats['retries']:6d} retries {stats['rate']:8.2f} per second")
+
+    # Let CI and cron jobs see that part of the batch failed
+    if failed:
+        sys.exit(1)
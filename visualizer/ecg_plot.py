@@ -1,7 +1,14 @@
 import numpy as np
 from matplotlib.ticker import AutoMinorLocator
+from matplotlib.collections import PolyCollection
 from math import ceil
 
+from data_utils.labels import WaveLabels
+
+
+# Colors of P-waves, QRS complexes and T-waves
+WAVE_COLORS = {1: 'green', 2: 'red', 3: 'blue'}
+
 
 def ax_plot_grid(ax, secs=10, amplitude_ecg=1.8, time_ticks=0.2, alpha=0.25):
     ax.set_xticks(np.arange(0, secs + 1, time_ticks))
@@ -20,6 +27,37 @@ def ax_plot_grid(ax, secs=10, amplitude_ecg=1.8, time_ticks=0.2, alpha=0.25):
             color=(1, 0.7, 0.7), alpha=alpha)
 
 
+def decimate_min_max(x, y, columns):
+    """
+    Reduces a signal to the minimum and maximum of each of `columns` equal bins of samples,
+    kept in time order. Drawn `columns` pixels wide this looks the same as the full signal,
+    including the peaks of QRS complexes. Signals of at most two samples per column are
+    returned unchanged.
+    """
+    n = len(y)
+    if columns <= 0 or n <= 2 * columns:
+        return x, y
+
+    bin_size = int(np.ceil(n / columns))
+    bins = np.pad(y, (0, bin_size * columns - n), mode='edge').reshape(columns, bin_size)
+
+    arg_min = bins.argmin(axis=1)
+    arg_max = bins.argmax(axis=1)
+    starts = np.arange(columns) * bin_size
+    indices = np.column_stack((starts + np.minimum(arg_min, arg_max),
+                               starts + np.maximum(arg_min, arg_max))).ravel()
+    indices = np.minimum(indices, n - 1)
+
+    return x[indices], y[indices]
+
+
+def ax_columns(ax, dpi):
+    """
+    Returns the width of an axes in pixel columns when its figure is rendered at `dpi`.
+    """
+    return int(ax.get_position().width * ax.figure.get_figwidth() * dpi)
+
+
 def ax_plot_signal(ax, x, y, **kwargs):
     ax.plot(x, y, **kwargs)
 
@@ -29,24 +67,43 @@ def ax_plot_region(ax, start, end, alpha=0.25, color='red'):
 
 
 def ax_plot_pqrst(ax, x, labels, alpha=0.25):
-    samples = labels.shape[0]
-    for i in range(samples - 1):
-        label = np.argmax(labels[i])
-
-        if label == 0:
+    """
+    Shades the P-waves, QRS complexes and T-waves of a strip. `labels` are WaveLabels
+    relative to `x` or a one-hot array with a row per sample. Touching waves of the same type
+    are merged and each type is drawn as a single collection.
+    """
+    if not isinstance(labels, WaveLabels):
+        labels = WaveLabels.from_dense(np.argmax(labels, axis=1))
+
+    # A wave spans from the x of its first sample to the x of the sample after it
+    last = len(x) - 1
+    starts = np.minimum(labels.starts, last)
+    ends = np.minimum(labels.ends, last)
+
+    for wave, color in WAVE_COLORS.items():
+        is_wave = (labels.waves == wave) & (starts < ends)
+        wave_starts = starts[is_wave]
+        wave_ends = ends[is_wave]
+        if len(wave_starts) == 0:
             continue
 
-        x0 = x[i]
-        x1 = x[i+1]
-
-        # P
-        if label == 1:
-            ax.axvspan(x0, x1, color='green', alpha=alpha)
-
-        # QRS
-        if label == 2:
-            ax.axvspan(x0, x1, color='red', alpha=alpha)
-
-        # T
-        if label == 3:
-            ax.axvspan(x0, x1, color='blue', alpha=alpha)
+        touching = wave_starts[1:] == wave_ends[:-1]
+        wave_starts = wave_starts[np.concatenate(([True], ~touching))]
+        wave_ends = wave_ends[np.concatenate((~touching, [True]))]
+
+        # Rectangles spanning the full height, like axvspan
+        x0 = x[wave_starts]
+        x1 = x[wave_ends]
+        bottom = np.zeros_like(x0)
+        top = np.ones_like(x0)
+        verts = np.stack([
+            np.column_stack((x0, bottom)),
+            np.column_stack((x0, top)),
+            np.column_stack((x1, top)),
+            np.column_stack((x1, bottom))
+        ], axis=1)
+
+        ax.add_collection(
+            PolyCollection(verts, transform=ax.get_xaxis_transform(),
+                           color=color, alpha=alpha),
+            autolim=False)
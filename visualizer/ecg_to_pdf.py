@@ -1,11 +1,20 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
 from matplotlib.backends.backend_pdf import PdfPages
 
 import visualizer.ecg_plot as ecg_plot
+from visualizer.strip_page import StripPage
 from data_utils.normalize_signal import normalize_signal, NormalizeMethod
+from data_utils.signal_source import SignalSource, CompactSignal, NpySignal
+from data_utils.labels import WaveLabels
+
+
+FIGSIZE = (8.3, 11.7)
+SECONDS_PER_FIG = 15
 
 
 class Region:
@@ -16,7 +25,75 @@ class Region:
         self.color = color
 
 
-def start_index_gen(tracing_length, chunk_size, num_of_figs):
+class RegionIndex:
+    """
+    **Regions sorted into arrays for fast lookup of the regions in a window**
+
+    Regions are grouped by their length rounded up to a power of two milliseconds and sorted
+    by start within each group. A region of a group can only overlap a window if it starts
+    less than the group's length before it, so every group is searched with two binary
+    searches and only a few regions around the window are checked.
+
+    Parameters
+    ----------
+    regions : list
+        The Region to index, in milliseconds.
+    """
+
+    def __init__(self, regions):
+        starts = np.array([region.start for region in regions], dtype=float)
+        ends = np.array([region.end for region in regions], dtype=float)
+
+        length_classes = np.ceil(np.log2(np.maximum(ends - starts, 1))).astype(np.int64)
+        order = np.lexsort((starts, length_classes))
+
+        # Overlapping regions are drawn in order of their start, as before indexing
+        ranks = np.empty(len(regions), dtype=np.int64)
+        ranks[np.argsort(starts, kind='stable')] = np.arange(len(regions))
+        self.ranks = ranks[order]
+
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.colors = [regions[i].color for i in order]
+        self.alphas = [regions[i].alpha for i in order]
+
+        # Without regions there are no groups and nothing overlaps any window
+        self.groups = []
+        if len(regions) == 0:
+            return
+
+        length_classes = length_classes[order]
+        bounds = np.flatnonzero(np.diff(length_classes)) + 1
+        group_starts = np.concatenate(([0], bounds)).astype(np.int64)
+        group_ends = np.concatenate((bounds, [len(regions)])).astype(np.int64)
+        self.groups = [(2.0 ** length_classes[first], first, last)
+                       for first, last in zip(group_starts, group_ends)]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, end):
+        """
+        Returns the indices of the regions overlapping `start` to `end` milliseconds, in order
+        of their start.
+        """
+        found = []
+        for max_length, first, last in self.groups:
+            group_starts = self.starts[first:last]
+            lo = first + np.searchsorted(group_starts, start - max_length, side='left')
+            hi = first + np.searchsorted(group_starts, end, side='left')
+
+            candidates = np.arange(lo, hi)
+            found.append(candidates[self.ends[candidates] > start])
+
+        if len(found) == 0:
+            return np.array([], dtype=np.int64)
+
+        found = np.concatenate(found)
+        return found[np.argsort(self.ranks[found], kind='stable')]
+
+
+def start_index_gen(tracing_length, chunk_size, num_of_figs, rng=np.random):
     if tracing_length is None:
         yield from [0]*num_of_figs
 
@@ -26,17 +103,135 @@ def start_index_gen(tracing_length, chunk_size, num_of_figs):
 
     # Yield random starting points
     else:
-        yield from np.sort(np.random.randint(
+        yield from np.sort(rng.randint(
             0, tracing_length - chunk_size, num_of_figs))
 
 
+def _draw_page(page, page_starts, sampling_rate, tracings, labels, regions):
+    n_leads = tracings.shape[0]
+    chunk_size = int(SECONDS_PER_FIG * sampling_rate)
+
+    step = 1.0/sampling_rate
+    time_x = np.arange(0, chunk_size*step, step)
+
+    for i, start in enumerate(page_starts):
+        end = start + chunk_size
+        chunk_start = start / sampling_rate
+
+        # Looked up once per strip and drawn on every lead
+        strip_regions = []
+        if regions is not None:
+            strip_regions = regions.overlapping(
+                1000.0 * start / sampling_rate, 1000.0 * end / sampling_rate)
+
+        for lead in range(n_leads):
+            ax = page.axes[i][lead]
+
+            if tracings is not None:
+                tracing_chunk = tracings[lead, start:end]
+                tracing_chunk, _ = normalize_signal(
+                    tracing_chunk, NormalizeMethod.Z_SCORE)
+                if len(tracing_chunk) < chunk_size:
+                    tmp = np.zeros(chunk_size)
+                    tmp[:len(tracing_chunk)] = tracing_chunk
+                    tracing_chunk = tmp
+
+            for region_i in strip_regions:
+                region_start = np.clip(
+                    regions.starts[region_i] / 1000.0 - chunk_start, 0, SECONDS_PER_FIG)
+                region_end = np.clip(
+                    regions.ends[region_i] / 1000.0 - chunk_start, 0, SECONDS_PER_FIG)
+
+                ecg_plot.ax_plot_region(
+                    ax,
+                    region_start,
+                    region_end,
+                    alpha=regions.alphas[region_i],
+                    color=regions.colors[region_i])
+
+            if labels is not None:
+                ecg_plot.ax_plot_pqrst(
+                    ax, time_x, labels.window(start, end), alpha=0.75)
+
+            tracing_chunk -= tracing_chunk.mean()
+            upper_limit = max(tracing_chunk)
+            lower_limit = min(tracing_chunk)
+            scaling_factor = 2 * 1.65 / (upper_limit - lower_limit)
+
+            tracing_chunk = tracing_chunk * scaling_factor
+            page.set_signal(i, lead, time_x, tracing_chunk)
+
+
+def _render_pages(output_path, pages, sampling_rate, tracings, labels, lead_names, regions,
+                  decimate_dpi=None, progress=True):
+    # The layout and grid are built once and reused by every page
+    n_leads = tracings.shape[0]
+    page = StripPage(12 // n_leads, n_leads, SECONDS_PER_FIG, lead_names, figsize=FIGSIZE,
+                     decimate_dpi=decimate_dpi)
+
+    with PdfPages(output_path) as pdf:
+        for page_starts in (tqdm(pages) if progress else pages):
+            _draw_page(page, page_starts, sampling_rate, tracings, labels, regions)
+
+            # Save figure
+            page.save(pdf, len(page_starts))
+
+
+def _render_pages_parallel(output_path, pages, sampling_rate, tracings, labels, lead_names,
+                           regions, decimate_dpi, workers):
+    # Imported here as it is only needed to assemble pages rendered in parallel
+    from pypdf import PdfWriter
+
+    tmp_path = tempfile.mkdtemp(
+        prefix='.pages_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        # Workers map the signal from disk instead of each receiving a pickled copy. Readers
+        # of files already pickle as their path.
+        if isinstance(tracings, (np.ndarray, CompactSignal)) and not isinstance(tracings, NpySignal):
+            samples = tracings.samples if isinstance(tracings, CompactSignal) else tracings
+            npy_path = os.path.join(tmp_path, 'tracings.npy')
+            np.save(npy_path, samples)
+            tracings = NpySignal(npy_path,
+                                 getattr(tracings, 'gains', None),
+                                 getattr(tracings, 'offsets', None))
+
+        # A few groups of consecutive pages per worker keeps them all busy until the end
+        group_size = max(1, int(np.ceil(len(pages) / (workers * 4))))
+        groups = [pages[i:i + group_size] for i in range(0, len(pages), group_size)]
+        part_paths = [os.path.join(tmp_path, f'part_{i:05d}.pdf') for i in range(len(groups))]
+
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(_render_pages, part_path, group, sampling_rate,
+                                tracings, labels, lead_names, regions, decimate_dpi, False)
+                for part_path, group in zip(part_paths, groups)]
+
+            with tqdm(total=len(pages)) as progress:
+                for future, group in zip(futures, groups):
+                    future.result()
+                    progress.update(len(group))
+
+        # Assemble the pages in order
+        writer = PdfWriter()
+        for part_path in part_paths:
+            writer.append(part_path)
+        with open(output_path, 'wb') as f:
+            writer.write(f)
+
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
 def ecg_to_pdf(
         sampling_rate: float,
         output_path: str,
         tracings, labels=None,
         lead_names=None,
         regions=None,
-        max_pages: int = -1):
+        max_pages: int = -1,
+        seed=None,
+        workers: int = 1,
+        decimate_dpi=None):
     """
     **Converts tracings, reconstructions, and/or labels into a pdf**
 
@@ -49,22 +244,36 @@ def ecg_to_pdf(
         The sampling rate of the given ecg in Hz.
     output_path : str
         The path where the pdf is saved to.
-    tracings : Union[None, np.array, list]
+    tracings : Union[None, np.array, list, SignalSource]
         A 2D-array of the original ecg signal. The first axis represents the different leads. The
-        second axis represents samples across time.
-    labels: Union[None, np.array, list]
+        second axis represents samples across time. A SignalSource (e.g. a CompactSignal of
+        int16 samples) is only read and converted to physical values where it is plotted.
+    labels: Union[None, np.array, list, WaveLabels]
         A 1D-array of the labels across time. This must have the same size as tracings and reconstructions'
         second axis, if labels is not None and either tracings or reconstructions are not None.
         0 represents no wave, 1 represents a P-wave, 2 represents a QRS complex, 3 represents a T-wave.
+        WaveLabels give the same labels as intervals, which is much smaller for long tracings.
         If None is given then no labels will be plotted.
     regions: Union[None,  list]
-        A list of regions. Will highlight an area on the ECG. See the class Region above.
+        A list of regions. Will highlight an area on the ECG. See the class Region above. They are
+        indexed once, see RegionIndex.
     lead_names : Union[None, list]
         The names of each lead.
         If None is given then all lead names will be empty strings
     max_pages : int
         The maximum number of pages the pdf can be. If the full tracing cannot fit in the under max_pages
         pages, then only random samples of the ecg will be selected.
+    seed : Union[None, int]
+        Seeds the selection of random samples, so the same pages are rendered every time.
+    workers : int
+        The number of processes rendering pages. Groups of consecutive pages are rendered to
+        separate PDFs, which are then merged in order. Requires pypdf. Workers use the
+        platform's default start method, so scripts passing more than one need an
+        `if __name__ == '__main__':` guard.
+    decimate_dpi : Union[None, float]
+        If given, each trace is reduced to the minimum and maximum of every pixel column it
+        covers at this resolution, so high sampling rates do not add points that cannot be
+        seen.
     """
     if sampling_rate <= 0:
         raise ValueError("Sampling rate must be positive")
@@ -76,13 +285,13 @@ def ecg_to_pdf(
     if isinstance(tracings, list):
         tracings = np.array(tracings)
 
-    elif not isinstance(tracings, np.ndarray):
+    elif not isinstance(tracings, (np.ndarray, SignalSource)):
         raise ValueError("tracings dtype not recognized")
 
     if isinstance(labels, list):
         labels = np.array(labels)
 
-    elif labels is not None and not isinstance(labels, np.ndarray):
+    elif labels is not None and not isinstance(labels, (np.ndarray, WaveLabels)):
         raise ValueError("labels dtype not recognized")
 
     if (not isinstance(lead_names, list) and
@@ -95,17 +304,24 @@ def ecg_to_pdf(
         raise ValueError(
             f"tracings must be 2-dimensional. Got {tracings.ndim} dimension(s)")
 
-    elif labels is not None and labels.ndim != 1:
+    elif isinstance(labels, np.ndarray) and labels.ndim != 1:
         raise ValueError(
             f"labels must be 1-dimensional. Got {labels.ndim} dimensions")
 
-    elif (labels is not None and
-          tracings.shape[1] != labels.shape[0]):
+    elif isinstance(labels, np.ndarray) and tracings.shape[1] != labels.shape[0]:
         raise ValueError(
             f"tracing's shape is {tracings.shape} which is incompatible with label's shape {labels.shape}")
 
+    elif isinstance(labels, WaveLabels) and tracings.shape[1] != labels.signal_length:
+        raise ValueError(
+            f"tracing's shape is {tracings.shape} which is incompatible with labels of "
+            f"{labels.signal_length} samples")
+
+    if isinstance(labels, np.ndarray):
+        labels = WaveLabels.from_dense(labels)
+
     if regions is not None:
-        regions = sorted(regions, key=lambda x: x.start)
+        regions = RegionIndex(regions)
 
     n_leads = tracings.shape[0]
     tracing_length = tracings.shape[1]
@@ -118,12 +334,8 @@ def ecg_to_pdf(
         raise ValueError(
             f"Number of leads is {n_leads}, but {len(lead_names)} lead names given.")
 
-    labels_one_hot = np.zeros((tracing_length, 4), dtype=np.uint8)
-    labels_one_hot[np.arange(tracing_length), labels] = 1
-
-    figsize = (8.3, 11.7)
     figs_per_page = 12 // n_leads
-    seconds_per_fig = 15
+    seconds_per_fig = SECONDS_PER_FIG
 
     if max_pages > 0 and seconds is None:
         num_pages = max_pages
@@ -147,109 +359,15 @@ def ecg_to_pdf(
 
     chunk_size = int(seconds_per_fig * sampling_rate)
 
-    step = 1.0/sampling_rate
-    time_x = np.arange(0, chunk_size*step, step)
-
-    # Create pages
-    gen = start_index_gen(tracing_length, chunk_size, num_of_figs)
-    with PdfPages(output_path) as pdf:
-        for page_i in tqdm(range(num_pages)):
-            page = plt.figure(figsize=figsize)
-            grid_sections = gridspec.GridSpec(
-                figs_per_page, 1, wspace=0.2, hspace=0.2)
-
-            # Only add as many figures as are needed
-            page_figures = min(figs_per_page, num_of_figs -
-                               page_i * figs_per_page)
-
-            for i in range(page_figures):
-                grid_leads = gridspec.GridSpecFromSubplotSpec(n_leads, 1,
-                                                              subplot_spec=grid_sections[i], wspace=0.1, hspace=0.0)
-
-                start = next(gen)
-                end = start + chunk_size
-
-                for lead in range(n_leads):
-                    ax = plt.Subplot(page, grid_leads[lead])
-
-                    if tracings is not None:
-                        tracing_chunk = tracings[lead, start:end]
-                        tracing_chunk, _ = normalize_signal(
-                            tracing_chunk, NormalizeMethod.Z_SCORE)
-                        if len(tracing_chunk) < chunk_size:
-                            tmp = np.zeros(chunk_size)
-                            tmp[:len(tracing_chunk)] = tracing_chunk
-                            tracing_chunk = tmp
-
-                    ecg_plot.ax_plot_grid(
-                        ax, seconds_per_fig, amplitude_ecg=1.8, alpha=0.1)
-
-                    if regions is not None:
-                        regions_start_idx = 0
-                        regions_end_idx = 0
-
-                        while regions_start_idx < len(regions):
-                            region = regions[regions_start_idx]
-                            region_start = (
-                                sampling_rate * region.end / 1000.0)
-                            if region_start >= start:
-                                break
-                            regions_start_idx += 1
-
-                        regions_end_idx = regions_start_idx
-                        while regions_end_idx < len(regions):
-                            region_end = (
-                                sampling_rate * region.start / 1000.0)
-                            if region_end >= end:
-                                break
-                            regions_end_idx += 1
-
-                        for i in range(regions_start_idx, regions_end_idx):
-                            region = regions[i]
-
-                            chuck_start = start / 250.0
-
-                            region_start = region.start / 1000.0 - chuck_start
-                            region_end = region.end / 1000.0 - chuck_start
-
-                            region_start = np.clip(
-                                region_start, 0, seconds_per_fig)
-                            region_end = np.clip(
-                                region_end, 0, seconds_per_fig)
-
-                            ecg_plot.ax_plot_region(
-                                ax,
-                                region_start,
-                                region_end,
-                                alpha=region.alpha,
-                                color=region.color)
-
-                    if labels_one_hot is not None:
-                        labels_chunk = labels_one_hot[start:end]
-                        if len(labels_chunk) < chunk_size:
-                            tmp = np.zeros((chunk_size, 4), dtype=np.uint8)
-                            tmp[:len(labels_chunk)] = labels_chunk
-                            labels_chunk = tmp
-
-                        ecg_plot.ax_plot_pqrst(
-                            ax, time_x, labels_chunk, alpha=0.75)
-
-                    tracing_chunk -= tracing_chunk.mean()
-                    upper_limit = max(tracing_chunk)
-                    lower_limit = min(tracing_chunk)
-                    scaling_factor = 2 * 1.65 / (upper_limit - lower_limit)
-
-                    tracing_chunk = tracing_chunk * scaling_factor
-                    ecg_plot.ax_plot_signal(ax, time_x, tracing_chunk,
-                                            linewidth=0.7, color='black', alpha=1.0)
-
-                    ax.set_xticklabels([])
-                    ax.set_yticklabels([])
-
-                    ax.set_ylabel(lead_names[lead])
-
-                    page.add_subplot(ax)
+    # Choose every strip up front so pages can be rendered in any order
+    rng = np.random if seed is None else np.random.RandomState(seed)
+    starts = list(start_index_gen(tracing_length, chunk_size, num_of_figs, rng))[:num_of_figs]
+    pages = [starts[i:i + figs_per_page]
+             for i in range(0, num_pages * figs_per_page, figs_per_page)]
 
-            # Save figure
-            pdf.savefig(page)
-            plt.close()
+    if workers > 1 and len(pages) > 1:
+        _render_pages_parallel(output_path, pages, sampling_rate, tracings, labels,
+                               lead_names, regions, decimate_dpi, workers)
+    else:
+        _render_pages(output_path, pages, sampling_rate, tracings, labels, lead_names,
+                      regions, decimate_dpi)
@@ -0,0 +1,146 @@
+import numpy as np
+from tqdm import tqdm
+from matplotlib.backends.backend_pdf import PdfPages
+
+import visualizer.ecg_plot as ecg_plot
+from visualizer.strip_page import StripPage
+from visualizer.ecg_to_pdf import RegionIndex
+from data_utils.labels import WaveLabels
+
+
+FIGSIZE = (11.7, 8.3)
+
+# Rows are scaled so most of the signal stays within this amplitude, the rest is clipped to
+# the grid
+ROW_AMPLITUDE = 1.2
+GRID_AMPLITUDE = 1.8
+
+
+def _scale_row(chunk):
+    chunk = chunk - np.median(chunk)
+    amplitude = np.percentile(np.abs(chunk), 99.5)
+    if amplitude > 0:
+        chunk = chunk * (ROW_AMPLITUDE / amplitude)
+
+    return np.clip(chunk, -GRID_AMPLITUDE, GRID_AMPLITUDE)
+
+
+def _row_title(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}'
+
+
+def full_disclosure_pdf(
+    sampling_rate,
+    output_path,
+    tracings,
+    labels=None,
+    regions=None,
+    lead_names=None,
+    row_seconds=60,
+    rows_per_page=20,
+    decimate_dpi=200,
+    progress=True,
+):
+    """
+    **Renders every sample of a recording as compressed rows of a pdf**
+
+    Each row shows `row_seconds` of every lead, many rows to a landscape page. Only the samples
+    of one page are read at a time and each page is written to the pdf as soon as it is drawn,
+    so memory does not grow with the length of the recording.
+
+    Parameters
+    ----------
+    sampling_rate : float
+        The sampling rate of the given ecg in Hz.
+    output_path : str
+        The path where the pdf is saved to.
+    tracings : Union[np.ndarray, SignalSource]
+        The signals with a row per lead. A SignalSource such as a MappedEdf is streamed from
+        disk.
+    labels : Union[None, WaveLabels]
+        The PQRST labels to shade.
+    regions : Union[None, list]
+        A list of Region, see ecg_to_pdf. Highlights an area on the ECG.
+    lead_names : Union[None, list]
+        The names of each lead.
+    row_seconds : float
+        The seconds shown by each row, e.g. 60 to 300.
+    rows_per_page : int
+        The number of rows on a page.
+    decimate_dpi : Union[None, float]
+        Traces are reduced to the minimum and maximum of each pixel column at this resolution,
+        see ecg_plot.decimate_min_max. None keeps every sample.
+    progress : bool
+        Shows a progress bar of the pages.
+    """
+    if sampling_rate <= 0:
+        raise ValueError("Sampling rate must be positive")
+
+    if tracings.ndim != 2:
+        raise ValueError(
+            f"tracings must be 2-dimensional. Got {tracings.ndim} dimension(s)")
+
+    if labels is not None and not isinstance(labels, WaveLabels):
+        raise ValueError("labels must be WaveLabels")
+
+    n_leads, n_samples = tracings.shape
+    if lead_names is not None and len(lead_names) != n_leads:
+        raise ValueError(
+            f"Number of leads is {n_leads}, but {len(lead_names)} lead names given.")
+
+    row_samples = int(row_seconds * sampling_rate)
+    if row_samples < 1:
+        raise ValueError('row_seconds must cover at least one sample')
+
+    page_samples = row_samples * rows_per_page
+    n_pages = -(-n_samples // page_samples)
+
+    time_x = np.arange(row_samples) / sampling_rate
+
+    regions = RegionIndex(regions if regions is not None else [])
+
+    # The layout and grid are built once and reused by every page
+    page = StripPage(rows_per_page, n_leads, row_seconds, lead_names, hspace=0.8,
+                     figsize=FIGSIZE, decimate_dpi=decimate_dpi,
+                     time_ticks=row_seconds / 12)
+
+    with PdfPages(output_path) as pdf:
+        for page_i in (tqdm(range(n_pages)) if progress else range(n_pages)):
+            page_start = page_i * page_samples
+            page_end = min(page_start + page_samples, n_samples)
+
+            page_chunk = tracings[:, page_start:page_end]
+            n_rows = -(-(page_end - page_start) // row_samples)
+
+            for row in range(n_rows):
+                start = page_start + row * row_samples
+                end = min(start + row_samples, page_end)
+                row_start = start / sampling_rate
+                row_regions = regions.overlapping(
+                    1000.0 * row_start, 1000.0 * (row_start + row_seconds))
+
+                for lead in range(n_leads):
+                    ax = page.axes[row][lead]
+
+                    for region_i in row_regions:
+                        ecg_plot.ax_plot_region(
+                            ax,
+                            max(regions.starts[region_i] / 1000.0 - row_start, 0),
+                            min(regions.ends[region_i] / 1000.0 - row_start, row_seconds),
+                            alpha=regions.alphas[region_i],
+                            color=regions.colors[region_i])
+
+                    if labels is not None:
+                        ecg_plot.ax_plot_pqrst(
+                            ax, time_x, labels.window(start, end), alpha=0.5)
+
+                    chunk = np.asarray(page_chunk[lead, start - page_start:end - page_start],
+                                       dtype=float)
+                    page.set_signal(row, lead, time_x[:len(chunk)], _scale_row(chunk))
+
+                    if lead == 0:
+                        ax.set_title(_row_title(row_start), loc='left', fontsize=5)
+
+            page.save(pdf, n_rows)
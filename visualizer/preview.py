@@ -0,0 +1,337 @@
+import os
+import glob
+import json
+import zlib
+import struct
+
+import numpy as np
+from matplotlib.colors import to_rgb
+
+from data_utils.edf_loader import load_edf
+from data_utils.labels import WaveLabels, intervals_from_beats
+from visualizer.ecg_plot import WAVE_COLORS
+from visualizer.ecg_to_pdf import Region
+
+
+# Colors of the events of an analysis.json, as in events.pdf
+EVENT_COLORS = {'afib': 'red', 'pac': 'yellow', 'pvc': 'orange',
+                'av_block': 'green', 'pauses': 'blue'}
+
+BACKGROUND = (255, 255, 255)
+GRID_COLOR = (255, 200, 200)
+ROW_COLOR = (160, 160, 160)
+
+# PQRST waves blur together when a column spans more than this many seconds
+MAX_WAVE_SECONDS_PER_COLUMN = 0.1
+
+# Previews are mostly flat colors, fast compression keeps them small enough
+PNG_COMPRESS_LEVEL = 1
+
+# Rows rasterized and written at once, bounds the memory of a tile of any size
+BLOCK_ROWS = 32
+
+
+class _PngWriter:
+    """
+    Writes an RGB PNG of a known size a block of pixel rows at a time, so the whole image
+    never has to be in memory.
+    """
+
+    def __init__(self, path, width, height, compress_level=PNG_COMPRESS_LEVEL):
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(compress_level)
+
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, pixels):
+        # Every scanline starts with its filter type, 0 is none
+        scanlines = np.zeros((pixels.shape[0], pixels.shape[1] * 3 + 1), dtype=np.uint8)
+        scanlines[:, 1:] = pixels.reshape(pixels.shape[0], -1)
+
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self.compressor.flush())
+        self._chunk(b'IEND', b'')
+        self.file.close()
+
+
+def _rgb(color):
+    return np.array(to_rgb(color)) * 255
+
+
+def _coverage(starts, ends, first_column, n_columns):
+    """
+    Returns which of `n_columns` columns, starting at `first_column`, overlap any of the
+    column ranges `starts` to `ends` (exclusive).
+    """
+    starts = np.clip(starts - first_column, 0, n_columns)
+    ends = np.clip(ends - first_column, 0, n_columns)
+    non_empty = ends > starts
+    starts = starts[non_empty]
+    ends = ends[non_empty]
+
+    steps = np.zeros(n_columns + 1, dtype=np.int64)
+    np.add.at(steps, starts, 1)
+    np.add.at(steps, ends, -1)
+    return np.cumsum(steps[:-1]) > 0
+
+
+def _shade(background, covered, color, alpha):
+    background[covered] = (1 - alpha) * background[covered] + alpha * _rgb(color)
+
+
+def _column_ranges(chunk, n_rows, row_samples, width):
+    """
+    Returns the minimum and maximum of the samples behind each pixel column of `n_rows` rows
+    of `width` columns. Columns past the end of `chunk` are NaN.
+    """
+    edges = (np.arange(n_rows * width) // width * row_samples
+             + np.arange(n_rows * width) % width * row_samples // width)
+    in_signal = edges < len(chunk)
+
+    lows = np.full(n_rows * width, np.nan)
+    highs = np.full(n_rows * width, np.nan)
+    if np.any(in_signal):
+        lows[in_signal] = np.minimum.reduceat(chunk, edges[in_signal])
+        highs[in_signal] = np.maximum.reduceat(chunk, edges[in_signal])
+
+    lows = lows.reshape(n_rows, width)
+    highs = highs.reshape(n_rows, width)
+
+    # Join each column to the one before it so steep slopes stay connected
+    prev_lows = np.concatenate((lows[:, :1], lows[:, :-1]), axis=1)
+    prev_highs = np.concatenate((highs[:, :1], highs[:, :-1]), axis=1)
+    return np.fmin(lows, prev_highs), np.fmax(highs, prev_lows)
+
+
+def _scale_rows(lows, highs, lead_height):
+    """
+    Converts column ranges to pixel rows, centering each row on its median and fitting its
+    largest deflections into the lead height.
+    """
+    with np.errstate(all='ignore'):
+        center = np.nanmedian((lows + highs) / 2, axis=1, keepdims=True)
+        amplitude = np.nanpercentile(
+            np.fmax(highs - center, center - lows), 99, axis=1, keepdims=True)
+    amplitude[~(amplitude > 0)] = 1.0
+
+    half = (lead_height - 1) / 2
+    scale = 0.9 * half / amplitude
+    top = np.clip(np.round(half - (highs - center) * scale), 0, lead_height - 1)
+    bottom = np.clip(np.round(half - (lows - center) * scale), 0, lead_height - 1)
+
+    # Empty columns are not drawn
+    empty = np.isnan(lows)
+    top[empty] = lead_height
+    bottom[empty] = -1
+    return top, bottom
+
+
+def _render_rows(tracings, first_row, n_rows, row_samples, width, lead_height, labels,
+                 region_columns, grid_columns):
+    n_leads, n_samples = tracings.shape
+    start = first_row * row_samples
+    end = min(start + n_rows * row_samples, n_samples)
+    first_column = first_row * width
+    n_columns = n_rows * width
+
+    # Background of every column: grid, then events, then waves
+    background = np.empty((n_columns, 3))
+    background[:] = BACKGROUND
+    background[np.arange(n_columns) % width % grid_columns == 0] = GRID_COLOR
+
+    for starts, ends, color, alpha in region_columns:
+        _shade(background, _coverage(starts, ends, first_column, n_columns), color, alpha)
+
+    if labels is not None:
+        window = labels.window(start, end)
+        wave_starts = window.starts * width // row_samples
+        wave_ends = -(-window.ends * width // row_samples)
+        for wave, color in WAVE_COLORS.items():
+            is_wave = window.waves == wave
+            _shade(background, _coverage(wave_starts[is_wave], wave_ends[is_wave],
+                                         0, n_columns), color, 0.35)
+
+    background = background.reshape(n_rows, 1, 1, width, 3).astype(np.uint8)
+
+    y = np.arange(lead_height).reshape(1, lead_height, 1)
+    tile = np.empty((n_rows, n_leads, lead_height, width, 3), dtype=np.uint8)
+    for lead in range(n_leads):
+        chunk = np.asarray(tracings[lead, start:end], dtype=float)
+        top, bottom = _scale_rows(
+            *_column_ranges(chunk, n_rows, row_samples, width), lead_height)
+
+        trace = (y >= top[:, None, :]) & (y <= bottom[:, None, :])
+        tile[:, lead] = np.where(trace[..., None], 0, background[:, 0])
+
+    # A line above every row
+    tile[:, 0, 0] = ROW_COLOR
+    return tile.reshape(n_rows * n_leads * lead_height, width, 3)
+
+
+def _save_tile(path, tracings, first_row, n_rows, row_samples, width, lead_height, labels,
+               region_columns, grid_columns):
+    png = _PngWriter(path, width, n_rows * tracings.shape[0] * lead_height)
+    try:
+        for row in range(0, n_rows, BLOCK_ROWS):
+            png.write(_render_rows(
+                tracings, first_row + row, min(BLOCK_ROWS, n_rows - row), row_samples, width,
+                lead_height, labels, region_columns, grid_columns))
+    finally:
+        png.close()
+
+
+def ecg_to_png(
+    sampling_rate,
+    output_path,
+    tracings,
+    labels=None,
+    regions=None,
+    row_seconds=60,
+    width=1500,
+    lead_height=48,
+    rows_per_tile=60,
+):
+    """
+    **Rasterizes a whole recording into PNG previews**
+
+    Each row of the image shows `row_seconds` of every lead, reduced to the minimum and
+    maximum of each pixel column, with the events and PQRST waves shaded behind it. Rows are
+    drawn straight into NumPy image buffers and streamed to the PNG a block at a time, so a
+    day long recording takes seconds and memory does not grow with its length. A light
+    vertical line marks every 10 seconds. Waves are only shaded while a column spans at most
+    0.1 seconds.
+
+    Parameters
+    ----------
+    sampling_rate : float
+        The sampling rate of the signals in Hz.
+    output_path : str
+        The path of the PNG. With `rows_per_tile`, tiles are saved next to it with their
+        number appended to the name.
+    tracings : Union[np.ndarray, SignalSource]
+        The signals with a row per lead. Only the samples of a few rows are read at once.
+    labels : Union[None, WaveLabels]
+        The PQRST labels to shade.
+    regions : Union[None, list]
+        The Region of each event to shade.
+    row_seconds : float
+        The seconds shown by each row.
+    width : int
+        The width of the image in pixels.
+    lead_height : int
+        The height of each lead of a row in pixels.
+    rows_per_tile : Union[None, int]
+        The recording is split into tiles of this many rows. With None a single contact sheet
+        of the whole recording is saved, which can be too tall for image viewers.
+
+    Returns
+    -------
+    list
+        The paths of the saved PNGs.
+    """
+    if tracings is None:
+        raise ValueError('tracings is None')
+    if labels is not None and not isinstance(labels, WaveLabels):
+        labels = WaveLabels.from_dense(np.argmax(labels, axis=1))
+
+    n_samples = tracings.shape[1]
+    row_samples = int(row_seconds * sampling_rate)
+    if row_samples < 1:
+        raise ValueError('row_seconds must cover at least one sample')
+
+    n_rows = -(-n_samples // row_samples)
+    if rows_per_tile is None:
+        rows_per_tile = n_rows
+
+    # Events in pixel columns counted from the start of the recording
+    region_columns = []
+    if regions is not None:
+        columns_per_ms = sampling_rate / 1000.0 * width / row_samples
+        for color in dict.fromkeys(region.color for region in regions):
+            color_regions = [region for region in regions if region.color == color]
+            starts = np.array([region.start for region in color_regions], dtype=float)
+            ends = np.array([region.end for region in color_regions], dtype=float)
+            region_columns.append((
+                np.floor(starts * columns_per_ms).astype(np.int64),
+                np.ceil(ends * columns_per_ms).astype(np.int64),
+                color,
+                color_regions[0].alpha))
+
+    if row_seconds / width > MAX_WAVE_SECONDS_PER_COLUMN:
+        labels = None
+
+    grid_columns = max(int(round(10.0 / row_seconds * width)), 1)
+
+    root, ext = os.path.splitext(output_path)
+    n_tiles = -(-n_rows // rows_per_tile)
+    paths = []
+    for i in range(n_tiles):
+        first_row = i * rows_per_tile
+        path = output_path if n_tiles == 1 else f'{root}_{i:03d}{ext or ".png"}'
+        _save_tile(path, tracings, first_row, min(rows_per_tile, n_rows - first_row),
+                   row_samples, width, lead_height, labels, region_columns, grid_columns)
+        paths.append(path)
+
+    return paths
+
+
+def event_regions(analysis_data):
+    """
+    Returns a Region for each event of an analysis.json, colored as in events.pdf.
+    """
+    regions = []
+    for name, color in EVENT_COLORS.items():
+        for event in analysis_data.get('events', {}).get(name, []):
+            regions.append(Region(event['s'], event['e'], color=color))
+
+    return regions
+
+
+def preview_outputs(folder_path, **kwargs):
+    """
+    Saves preview.png of the original EDF and clean_preview.png of ecg.edf in an output
+    folder of run_all_edfs.py, shaded with the waves and events of its analysis.json.
+    Keyword arguments are passed on to `ecg_to_png`.
+
+    This only takes picklable arguments so it can run in a worker process.
+    """
+    with open(os.path.join(folder_path, 'analysis.json')) as f:
+        d = json.load(f)
+
+    regions = event_regions(d)
+
+    edf_paths = sorted(glob.glob(os.path.join(folder_path, '*.edf')))
+    outputs = {}
+    for edf_path in edf_paths:
+        name = 'clean_preview.png' if os.path.basename(edf_path) == 'ecg.edf' else 'preview.png'
+        outputs.setdefault(name, edf_path)
+
+    paths = []
+    for name, edf_path in outputs.items():
+        edf_data = load_edf(edf_path, lazy=True)
+        try:
+            labels = WaveLabels.from_intervals(*intervals_from_beats(d['beats']),
+                                               edf_data.sampling_rate,
+                                               edf_data.tracings.shape[1])
+            paths += ecg_to_png(
+                sampling_rate=edf_data.sampling_rate,
+                output_path=os.path.join(folder_path, name),
+                tracings=edf_data.tracings,
+                labels=labels,
+                regions=regions,
+                **kwargs)
+        finally:
+            edf_data.close()
+
+    return paths
@@ -0,0 +1,138 @@
+import os
+import json
+from tqdm import tqdm
+
+from data_utils.edf_loader import EdfCache
+from data_utils.labels import WaveLabels, intervals_from_beats
+from visualizer.ecg_to_pdf import Region, ecg_to_pdf
+from visualizer.report import report
+
+
+# Print a progress message prefixed with the file it belongs to
+def log(edf_file, message):
+    tqdm.write(f'[{os.path.basename(edf_file)}] {message}')
+
+
+def save_tracing(edf_data, json_data, output_path, max_pages=1):
+    tracings = edf_data.tracings
+    sampling_rate = edf_data.sampling_rate
+
+    # Create labels
+    labels = WaveLabels.from_intervals(*intervals_from_beats(json_data['beats']),
+                                       sampling_rate, tracings.shape[1])
+
+    # Save
+    ecg_to_pdf(
+        sampling_rate=sampling_rate,
+        output_path=output_path,
+        tracings=tracings,
+        labels=labels,
+        max_pages=max_pages
+    )
+
+
+def render_outputs(edf_path, folder_path, max_pages=1, edf_cache=None, signal_cache=False):
+    """
+    Renders tracing.pdf, clean_tracing.pdf and, when the analysis has events and stats,
+    report.pdf and events.pdf into `folder_path`.
+
+    Each EDF is loaded once and shared by every artifact rendered from it. Pass an
+    `edf_cache` to also share them across calls, by default they are closed on return.
+    `signal_cache` reads samples from the decoded-signal cache next to each EDF.
+
+    This only takes picklable arguments so it can run in a worker process.
+    """
+    # Sampled pages only read the strips they plot, full renders decode each EDF once
+    owns_cache = edf_cache is None
+    if owns_cache:
+        edf_cache = EdfCache(lazy=max_pages > 0, signal_cache=signal_cache)
+
+    try:
+        log(edf_path, 'Loading JSON ...')
+        with open(os.path.join(folder_path, 'analysis.json')) as f:
+            d = json.load(f)
+
+            log(edf_path, 'Loading EDF ...')
+            edf_data = edf_cache.load(edf_path)
+
+            save_tracing(edf_data, d, os.path.join(folder_path, 'tracing.pdf'),
+                         max_pages)
+            save_tracing(edf_cache.load(os.path.join(folder_path, 'ecg.edf')), d,
+                         os.path.join(folder_path, 'clean_tracing.pdf'), max_pages)
+
+            if 'events' in d and 'stats' in d:
+                tracings = edf_data.tracings
+                sampling_rate = edf_data.sampling_rate
+
+                # Save
+                log(edf_path, 'Saving Report ...')
+                report(
+                    tracings,
+                    sampling_rate,
+                    d,
+                    os.path.join(folder_path, 'report.pdf')
+                )
+
+                regions = []
+
+                events = d['events']
+
+                afib_events = events['afib']
+                pac_events = events['pac']
+                pvc_events = events['pvc']
+                av_block_events = events['av_block']
+                pause_events = events['pauses']
+
+                for event in afib_events:
+                    regions.append(
+                        Region(
+                            event['s'],
+                            event['e'],
+                            color='red'
+                        ))
+
+                for event in pac_events:
+                    regions.append(
+                        Region(
+                            event['s'],
+                            event['e'],
+                            color='yellow'
+                        ))
+
+                for event in pvc_events:
+                    regions.append(
+                        Region(
+                            event['s'],
+                            event['e'],
+                            color='orange'
+                        ))
+
+                for event in av_block_events:
+                    regions.append(
+                        Region(
+                            event['s'],
+                            event['e'],
+                            color='green'
+                        ))
+
+                for event in pause_events:
+                    regions.append(
+                        Region(
+                            event['s'],
+                            event['e'],
+                            color='blue'
+                        ))
+
+                # Save
+                log(edf_path, 'Saving Events ...')
+                ecg_to_pdf(
+                    sampling_rate=sampling_rate,
+                    output_path=os.path.join(folder_path, 'events.pdf'),
+                    tracings=tracings,
+                    regions=regions,
+                    max_pages=max_pages
+                )
+
+    finally:
+        if owns_cache:
+            edf_cache.clear()
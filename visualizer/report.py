@@ -1,12 +1,12 @@
 import random
 
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_pdf import PdfPages
 
 from data_utils.normalize_signal import normalize_signal, NormalizeMethod
 import visualizer.ecg_plot as ecg_plot
+from visualizer.strip_page import StripPage
 
 
 class Region:
@@ -26,7 +26,8 @@ def report(
     tracings,
     sampling_rate,
     analysis_data,
-    pdf_output_path
+    pdf_output_path,
+    decimate_dpi=None
 ):
     leads = tracings.shape[0]
     figsize = (8.3, 11.7)
@@ -37,16 +38,16 @@ def report(
     step = 1.0/sampling_rate
     time_x = np.arange(0, chunk_size*step, step)
 
-    page = plt.figure(figsize=figsize)
+    page = Figure(figsize=figsize)
 
     with PdfPages(pdf_output_path) as pdf:
 
         # Plots
-        grid_plots = gridspec.GridSpec(
+        grid_plots = page.add_gridspec(
             2, 1, wspace=0.2, hspace=0.2)
 
-        ax0 = plt.Subplot(page, grid_plots[0])
-        ax1 = plt.Subplot(page, grid_plots[1])
+        ax0 = page.add_subplot(grid_plots[0])
+        ax1 = page.add_subplot(grid_plots[1])
 
         stats = analysis_data["stats"]
         rr_histogram = stats["rr_histogram"]
@@ -66,18 +67,14 @@ def report(
         ax1.stairs(y, x, fill=True)
         ax1.set_title("QTc (ms)")
 
-        page.add_subplot(ax0)
-        page.add_subplot(ax1)
-
         pdf.savefig(page)
-        plt.close()
 
         events = analysis_data["events"]
         py_events = []
 
-        page = plt.figure(figsize=figsize)
-        grid_sections = gridspec.GridSpec(
-            figs_per_page, 1, wspace=0.2, hspace=0.5)
+        # The layout and grid are built once and reused by every page
+        page = StripPage(figs_per_page, leads, seconds_per_fig,
+                         hspace=0.5, figsize=figsize, decimate_dpi=decimate_dpi)
 
         figs_on_page = 0
         all_events = []
@@ -322,23 +319,15 @@ def report(
         for event in py_events:
             if figs_on_page >= figs_per_page:
                 # Save figure
-                pdf.savefig(page)
-                plt.close()
-                page = plt.figure(figsize=figsize)
-
-                grid_sections = gridspec.GridSpec(
-                    figs_per_page, 1, wspace=0.2, hspace=0.5)
+                page.save(pdf, figs_on_page)
 
                 figs_on_page = 0
 
-            grid_leads = gridspec.GridSpecFromSubplotSpec(leads, 1,
-                                                          subplot_spec=grid_sections[figs_on_page], wspace=0.1, hspace=0.0)
+            strip = figs_on_page
             figs_on_page += 1
 
             for lead in range(leads):
-                ax = plt.Subplot(page, grid_leads[lead])
-                ecg_plot.ax_plot_grid(
-                    ax, seconds_per_fig, amplitude_ecg=1.8, alpha=0.1)
+                ax = page.axes[strip][lead]
                 if event.region is not None:
                     if isinstance(event.region, list):
                         for region in event.region:
@@ -357,18 +346,11 @@ def report(
                 tracing_chunk, _ = normalize_signal(
                     tracing_chunk, NormalizeMethod.Z_SCORE)
 
-                ecg_plot.ax_plot_signal(ax, time_x, tracing_chunk,
-                                        linewidth=0.7, color='black', alpha=1.0)
-
-                ax.set_xticklabels([])
-                ax.set_yticklabels([])
+                page.set_signal(strip, lead, time_x, tracing_chunk)
 
                 if lead == 0:
                     ax.set_title(
                         event.title,
                         loc='left', fontsize=5)
 
-                page.add_subplot(ax)
-
-        pdf.savefig(page)
-    plt.close()
+        page.save(pdf, figs_on_page)
@@ -0,0 +1,90 @@
+from matplotlib.figure import Figure
+
+import visualizer.ecg_plot as ecg_plot
+
+
+class StripPage:
+    """
+    **A reusable page of ECG strips**
+
+    The figure, its layout and the ECG paper grid of every axes are built once. Each page then
+    only swaps in the trace data and the overlays of its strips, which are cleared again when
+    the page is saved.
+
+    Parameters
+    ----------
+    figs_per_page : int
+        The number of strips on a page.
+    n_leads : int
+        The number of leads of each strip, each lead gets its own axes.
+    seconds : float
+        The seconds shown by each strip.
+    lead_names : Union[None, list]
+        The y-axis label of each lead.
+    hspace : float
+        The space between strips.
+    figsize : tuple
+        The size of the page in inches.
+    time_ticks : float
+        The seconds between major grid lines.
+    decimate_dpi : Union[None, float]
+        If given, traces are reduced to the minimum and maximum of each pixel column at this
+        resolution (see ecg_plot.decimate_min_max).
+    """
+
+    def __init__(self, figs_per_page, n_leads, seconds=15, lead_names=None, hspace=0.2,
+                 figsize=(8.3, 11.7), decimate_dpi=None, time_ticks=0.2):
+        self.decimate_dpi = decimate_dpi
+        self.figure = Figure(figsize=figsize)
+        grid_sections = self.figure.add_gridspec(
+            figs_per_page, 1, wspace=0.2, hspace=hspace)
+
+        self.axes = []
+        self.lines = []
+        for i in range(figs_per_page):
+            grid_leads = grid_sections[i].subgridspec(
+                n_leads, 1, wspace=0.1, hspace=0.0)
+
+            strip_axes = []
+            strip_lines = []
+            for lead in range(n_leads):
+                ax = self.figure.add_subplot(grid_leads[lead])
+                ecg_plot.ax_plot_grid(
+                    ax, seconds, amplitude_ecg=1.8, time_ticks=time_ticks, alpha=0.1)
+
+                line, = ax.plot([], [], linewidth=0.7, color='black', alpha=1.0)
+
+                ax.set_xticklabels([])
+                ax.set_yticklabels([])
+                if lead_names is not None:
+                    ax.set_ylabel(lead_names[lead])
+
+                strip_axes.append(ax)
+                strip_lines.append(line)
+
+            self.axes.append(strip_axes)
+            self.lines.append(strip_lines)
+
+    def set_signal(self, strip, lead, x, y):
+        if self.decimate_dpi is not None:
+            x, y = ecg_plot.decimate_min_max(
+                x, y, ecg_plot.ax_columns(self.axes[strip][lead], self.decimate_dpi))
+
+        self.lines[strip][lead].set_data(x, y)
+
+    def save(self, pdf, n_strips):
+        """
+        Saves the first `n_strips` strips as a page of `pdf` and clears their data.
+        """
+        for i, strip_axes in enumerate(self.axes):
+            for ax in strip_axes:
+                ax.set_visible(i < n_strips)
+
+        pdf.savefig(self.figure)
+
+        for strip_axes, strip_lines in zip(self.axes, self.lines):
+            for ax, line in zip(strip_axes, strip_lines):
+                for artist in list(ax.patches) + list(ax.collections):
+                    artist.remove()
+                ax.set_title('', loc='left')
+                line.set_data([], [])